@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import ValidationError
@@ -7,7 +8,15 @@ import dotenv
 
 dotenv.load_dotenv()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The CSG fallback client keeps one connection pool for the worker's lifetime
+    yield
+    await quotes.csg_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 sync_url = os.getenv("NEW_QUOTE_DB_URL")
 auth_token = os.getenv("NEW_QUOTE_DB_KEY")
@@ -19,6 +19,39 @@ class RateStore(Base):
     effective_date = Column(TEXT, primary_key=False, index=True)
     value = Column(JSON, primary_key=False)
 
+class RateBlob(Base):
+    __tablename__ = 'rate_blob'
+
+    hash = Column(TEXT, primary_key=True)
+    value = Column(JSON, primary_key=False)
+
+class RateRef(Base):
+    __tablename__ = 'rate_ref'
+
+    key = Column(TEXT, primary_key=True)
+    effective_date = Column(TEXT, primary_key=True)
+    hash = Column(TEXT, primary_key=False, index=True)
+
+class RateRow(Base):
+    __tablename__ = 'rate_row'
+
+    state = Column(TEXT, primary_key=True)
+    naic = Column(TEXT, primary_key=True)
+    naic_group = Column(INTEGER, primary_key=True)
+    effective_date = Column(TEXT, primary_key=True)
+    plan = Column(TEXT, primary_key=True)
+    gender = Column(TEXT, primary_key=True)
+    tobacco = Column(INTEGER, primary_key=True)
+    age = Column(INTEGER, primary_key=True)
+    rate_cents = Column(INTEGER)
+    discount_rate_cents = Column(INTEGER)
+
+    __table_args__ = (
+        Index('idx_rate_row_cell', 'state', 'effective_date', 'plan', 'gender', 'tobacco', 'age',
+              'naic', 'naic_group', 'rate_cents', 'discount_rate_cents'),
+        {'sqlite_with_rowid': False},
+    )
+
 class CompanyNames(Base):
     __tablename__ = 'company_names'
 
@@ -4,9 +4,9 @@ from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
 from app.database import get_db
-from app.models import GroupMapping, CompanyNames, CarrierSelection
+from app.models import GroupMapping, CompanyNames, CarrierSelection, RateRow
 import json
-from zips import zipHolder
+from zips import get_zip_holder
 import os
 from fastapi.security.api_key import APIKeyHeader
 from starlette.status import HTTP_403_FORBIDDEN
@@ -28,7 +28,7 @@ router = APIRouter()
 
 # Initialize CSG client for fallback
 csg_client = AsyncCSGRequest(Config.API_KEY)
-zip_helper = zipHolder("static/uszips.csv")
+zip_helper = get_zip_holder()
 
 
 
@@ -311,6 +311,42 @@ async def fetch_quotes_from_db(db: Session, state: str, zip_code: str, county: s
     results = []
     for mapping, company_name in group_mappings:
         store_key = f"{state}:{mapping.naic}:{mapping.naic_group}"
+
+        discount_category = db.execute(text("""
+            SELECT discount_category 
+            FROM carrier_selection 
+            WHERE naic = :naic
+        """), {'naic': mapping.naic}).scalar()
+
+        # a fully specified cell is one indexed read of rate_row
+        if age and gender and plan and tobacco is not None:
+            try:
+                row = db.get(RateRow, (state, mapping.naic, mapping.naic_group,
+                                       effective_date or get_effective_date(),
+                                       plan, gender, int(tobacco), age[0]))
+            except Exception as e:
+                print(f"rate_row lookup failed, using rate_store: {e}")
+                db.rollback()
+                row = None
+            if row is not None:
+                qr = QuoteResponse(
+                    naic=mapping.naic,
+                    group=mapping.naic_group,
+                    company_name=company_name or "Unknown",
+                    quotes=[QuoteInt(
+                        age=row.age,
+                        gender=row.gender,
+                        plan=row.plan,
+                        tobacco=row.tobacco,
+                        rate=row.rate_cents,
+                        discount_rate=row.discount_rate_cents,
+                        discount_category=discount_category
+                    )]
+                )
+                if qr.naic == '60380':
+                    qr.company_name = 'AFLAC'
+                results.append(qr)
+                continue
         
         # Build pattern for the inner JSON keys
         inner_key_parts = [
@@ -325,7 +361,7 @@ async def fetch_quotes_from_db(db: Session, state: str, zip_code: str, county: s
         sql_query = text("""
             WITH json_data AS (
                 SELECT value as json_blob
-                FROM rate_store 
+                FROM rate_store_all 
                 WHERE key = :store_key
                 AND effective_date = :effective_date
             ),
@@ -344,14 +380,6 @@ async def fetch_quotes_from_db(db: Session, state: str, zip_code: str, county: s
             'effective_date': effective_date or get_effective_date()
         }).scalar()
 
-        discount_category = db.execute(text("""
-            SELECT discount_category 
-            FROM carrier_selection 
-            WHERE naic = :naic
-        """), {'naic': mapping.naic}).scalar()
-
-
-
         if result:
             try:
                 # Parse the outer JSON array
@@ -1,20 +1,27 @@
 import httpx
-from httpx import ReadTimeout
 
 from toolz.functoolz import pipe
 from datetime import datetime, timedelta
+import base64
 import configparser
-from copy import copy
+import importlib.util
+import json
+import os
+from copy import copy, deepcopy
 import asyncio
+from collections import deque
+from itertools import chain
 from babel.numbers import format_currency
 
 from config import Config
-
-from aiocache import cached
+from csg_cache import QuoteMemo, ResponseCache, payload_key
+from mapping_checkpoint import MappingCheckpoint, probe_key
+from carrier_categories import get_carrier_categories
+from probe_planner import ProbePlanner, county_groups, zip_groups
+from region_registry import RegionRegistry
 
 import time
 from pprint import pprint
-import csv
 import logging
 import random
 
@@ -30,11 +37,67 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-from zips import zipHolder
+from zips import get_zip_holder
 
 # try to get current token
 
 TIMEOUT = 60.0
+_DONE = object()  # end of explore()'s items
+
+# refresh the token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 120
+
+MEDSUPP_PLANS = ['A', 'B', 'C', 'D', 'F', 'G', 'HDF', 'HDG', 'K', 'L', 'M', 'N']
+
+# Humana-family carriers whose county regions are hand-patched per state in
+# calc_naic_map_county; they are always mapped one carrier at a time there
+HUMANA_NAICS = ['73288', '60984', '60052', '88595', '60219']
+HUMANA_WORKAROUND_STATES = {'LA', 'AL', 'MD', 'AK', 'TX', 'IL', 'MO', 'FL', 'MI'}
+
+# NAICs filed by one company that share rating regions; one member is mapped
+# and the rest are spot-checked against it
+CARRIER_FAMILIES = [HUMANA_NAICS]
+
+
+def needs_individual_map(state, naic):
+  if state == 'WY' and naic == '82538':
+    return True
+  if state == 'LA':
+    return naic in ['73288', '60984', '60052']
+  return state in HUMANA_WORKAROUND_STATES and naic in HUMANA_NAICS
+
+
+def county_region(state, counties, city_items):
+  """A quote's location_base counties as calc_naic_map_county stores them.
+
+  Independent cities (VA) and FL's SAINT spellings are recorded in
+  city_items and left out of the region.
+  """
+  base = set(counties)
+  if state == 'LA':
+    base = process_st(base)
+  for c in list(base):
+    if c.endswith(' CITY'):
+      city_items.add(c[:-5])
+    if state == 'FL':
+      if c == 'SAINT JOHNS':
+        city_items.add(c)
+        base.add('ST. JOHNS')
+      if c == 'SAINT LUCIE':
+        city_items.add(c)
+        base.add('ST. LUCIE')
+  return base - city_items
+
+
+def carrier_family(naic):
+  return next((f for f in CARRIER_FAMILIES if naic in f), None)
+
+
+def family_siblings(state, naic):
+  """Family members of naic that go through the same mapping path in state."""
+  family = carrier_family(naic) or []
+  return [n for n in family
+          if n != naic and needs_individual_map(state, n) == needs_individual_map(state, naic)]
 
 
 
@@ -61,45 +124,371 @@ def rate_limited(interval):
 #fetch_sheet_and_export_to_csv()
 
 
-def csv_to_dict(filename):
-  with open(filename, 'r') as file:
-    reader = csv.DictReader(file)
-    result = {}
-    for row in reader:
-      # Convert 'Category' and 'ID' to integers
-      row["Category"] = map_cat(row["Category"])  #int(row["Category"])
-      # Check for null string key and filter it out
-      if "" in row:
-        del row[""]
-      # Replace blank strings with None
-      for key, value in row.items():
-        if value == '':
-          row[key] = None
-      result[row["ID"]] = row
-  return result
-
-
-def map_cat(a_or_b: str):
-  if a_or_b.lower() == "a":
-    return 0
-  elif a_or_b.lower() == "b":
-    return 1
-  else:
-    return 2
+def token_expiry(token, issued_at, expires_in=None):
+  """When a token expires: the JWT exp claim if there is one, else the
+  lifetime the token response gave, else issued_at + Config.CSG_TOKEN_TTL.
+  None means unknown; the token is then only refreshed when CSG rejects it."""
+  try:
+    payload = token.split('.')[1]
+    claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    return float(claims['exp'])
+  except Exception:
+    pass
+  if expires_in:
+    return issued_at + float(expires_in)
+  if Config.CSG_TOKEN_TTL:
+    return issued_at + Config.CSG_TOKEN_TTL
+  return None
+
+
+def response_lifetime(body):
+  """Seconds a token response says its token lives, if it says at all."""
+  try:
+    if body.get('expires_in'):
+      return float(body['expires_in'])
+    if body.get('expires_at'):
+      return float(body['expires_at']) - time.time()
+  except (TypeError, ValueError):
+    pass
+  return None
+
+
+class AdaptiveLimiter:
+  """AIMD request pacer for the CSG API.
+
+  Requests are spaced 1/rate seconds apart. Every `window` healthy responses
+  (fast, not 429/5xx) add `increase` req/s up to `max_rate`, but only while
+  the failure EWMA is under `max_error_rate`; a 429, 5xx or timeout
+  multiplies the rate by `decrease`, at most once per cooldown so a burst of
+  failures from one congestion event only backs off once.
+  """
+
+  def __init__(self,
+               rate=None,
+               min_rate=None,
+               max_rate=None,
+               increase=1.0,
+               decrease=0.5,
+               target_latency=5.0,
+               window=20,
+               max_error_rate=0.02):
+    self.rate = float(rate or Config.CSG_RATE)
+    self.min_rate = float(min_rate or Config.CSG_MIN_RATE)
+    self.max_rate = float(max_rate or Config.CSG_MAX_RATE)
+    self.increase = increase
+    self.decrease = decrease
+    self.target_latency = target_latency
+    self.window = window
+    self.max_error_rate = max_error_rate
+    self.latency = None  # EWMA of response time, seconds
+    self.error_rate = 0.0  # EWMA of failures per response
+    self._healthy = 0
+    self._next_slot = 0.0
+    self._last_decrease = 0.0
+
+  @property
+  def current_rate(self):
+    return self.rate
+
+  def stats(self):
+    return {
+        'rate': round(self.rate, 2),
+        'latency': round(self.latency, 3) if self.latency is not None else None,
+        'error_rate': round(self.error_rate, 4),
+    }
+
+  async def acquire(self):
+    # reserve the next free slot before sleeping so concurrent callers queue up
+    now = time.monotonic()
+    slot = max(now, self._next_slot)
+    self._next_slot = slot + 1.0 / self.rate
+    if slot > now:
+      await asyncio.sleep(slot - now)
+
+  async def __aenter__(self):
+    await self.acquire()
+    return self
+
+  async def __aexit__(self, *exc_info):
+    return False
+
+  def record_success(self, latency):
+    self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+    self.error_rate *= 0.95
+    # fast responses between failures don't earn a higher rate
+    if latency > self.target_latency or self.error_rate > self.max_error_rate:
+      self._healthy = 0
+      return
+    self._healthy += 1
+    if self._healthy >= self.window and self.rate < self.max_rate:
+      self._healthy = 0
+      self.rate = min(self.max_rate, self.rate + self.increase)
+      logging.debug(f"CSG rate raised to {self.rate:.1f}/s")
+
+  def record_failure(self):
+    self.error_rate = 0.95 * self.error_rate + 0.05
+    self._healthy = 0
+    now = time.monotonic()
+    cooldown = max(1.0, self.latency or 0.0)
+    if now - self._last_decrease < cooldown:
+      return
+    self._last_decrease = now
+    self.rate = max(self.min_rate, self.rate * self.decrease)
+    logging.warning(f"CSG throttling or errors; rate lowered to {self.rate:.1f}/s")
+
+
+_shared_limiter = None
+
+
+def shared_limiter():
+  """The process-wide limiter every AsyncCSGRequest uses unless given its own."""
+  global _shared_limiter
+  if _shared_limiter is None:
+    _shared_limiter = AdaptiveLimiter()
+  return _shared_limiter
+
+
+def is_retryable(exc):
+  """Timeouts, connection failures, 429 and 5xx are worth another try."""
+  if isinstance(exc, httpx.HTTPStatusError):
+    status = exc.response.status_code
+    return status == 429 or status >= 500
+  return isinstance(exc, httpx.TransportError)
+
+
+class RetryBudget:
+  """Caps retries at a fraction of first attempts.
+
+  Each first attempt deposits `ratio` tokens and each retry spends one, with
+  a trickle of `min_per_sec` so a quiet process can still retry. During an
+  outage the budget drains and failures stop multiplying traffic.
+  """
+
+  def __init__(self, ratio=0.2, min_per_sec=1.0, max_balance=50.0):
+    self.ratio = ratio
+    self.min_per_sec = min_per_sec
+    self.max_balance = max_balance
+    self.balance = max_balance
+    self.retries = 0
+    self.denied = 0
+    self._last = time.monotonic()
+
+  def _refill(self):
+    now = time.monotonic()
+    self.balance = min(self.max_balance, self.balance + (now - self._last) * self.min_per_sec)
+    self._last = now
+
+  def record_attempt(self):
+    self._refill()
+    self.balance = min(self.max_balance, self.balance + self.ratio)
+
+  def try_spend(self):
+    self._refill()
+    if self.balance >= 1.0:
+      self.balance -= 1.0
+      self.retries += 1
+      return True
+    self.denied += 1
+    return False
+
+
+class CircuitBreaker:
+  """Pauses every CSG caller once the API looks down.
+
+  After `failure_threshold` consecutive transport failures, 429s or 5xx the
+  breaker opens and callers wait in wait() for `reset_timeout` seconds. Then
+  one probe request goes through; success closes the breaker, failure opens
+  it again.
+  """
+
+  def __init__(self, failure_threshold=20, reset_timeout=30.0):
+    self.failure_threshold = failure_threshold
+    self.reset_timeout = reset_timeout
+    self.state = 'closed'
+    self.failures = 0
+    self.trips = 0
+    self._opened_at = 0.0
+    self._probing = False
+    self._probe_started = 0.0
+
+  async def wait(self):
+    while self.state != 'closed':
+      if self.state == 'open':
+        remaining = self._opened_at + self.reset_timeout - time.monotonic()
+        if remaining > 0:
+          await asyncio.sleep(remaining)
+          continue
+        self.state = 'half_open'
+      # let one probe through; a probe that never reported back times out
+      if not self._probing or time.monotonic() - self._probe_started > self.reset_timeout:
+        self._probing = True
+        self._probe_started = time.monotonic()
+        return
+      await asyncio.sleep(0.5)
+
+  def record_success(self):
+    self.failures = 0
+    self._probing = False
+    if self.state != 'closed':
+      logging.info("CSG circuit closed; resuming")
+      self.state = 'closed'
+
+  def record_failure(self):
+    self.failures += 1
+    self._probing = False
+    if self.state == 'half_open' or (self.state == 'closed' and
+                                     self.failures >= self.failure_threshold):
+      self.state = 'open'
+      self._opened_at = time.monotonic()
+      self.trips += 1
+      logging.warning(f"CSG circuit open after {self.failures} failures; "
+                      f"pausing requests for {self.reset_timeout}s")
+
+
+class RetryPolicy:
+  """Exponential backoff with full jitter, bounded by a shared retry budget
+  and gated by a shared circuit breaker."""
+
+  def __init__(self, max_attempts=4, base_delay=0.5, max_delay=30.0, budget=None, breaker=None):
+    self.max_attempts = max_attempts
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.budget = budget or RetryBudget()
+    self.breaker = breaker or CircuitBreaker()
+
+  def backoff(self, attempt):
+    return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+  async def run(self, fn, *args, max_attempts=None, retry_on=is_retryable, **kwargs):
+    max_attempts = max_attempts or self.max_attempts
+    self.budget.record_attempt()
+    attempt = 1
+    while True:
+      await self.breaker.wait()
+      try:
+        return await fn(*args, **kwargs)
+      except Exception as e:
+        if attempt >= max_attempts or not retry_on(e) or not self.budget.try_spend():
+          raise
+        delay = self.backoff(attempt)
+        logging.info(f"Retrying after {type(e).__name__} ({attempt}/{max_attempts}) in {delay:.2f}s")
+        attempt += 1
+        await asyncio.sleep(delay)
+
+  def stats(self):
+    return {
+        'retries': self.budget.retries,
+        'retries_denied': self.budget.denied,
+        'circuit': self.breaker.state,
+        'circuit_trips': self.breaker.trips,
+    }
+
+
+_shared_retry_policy = None
+
+
+def shared_retry_policy():
+  """The process-wide retry policy; its budget and breaker span all callers."""
+  global _shared_retry_policy
+  if _shared_retry_policy is None:
+    _shared_retry_policy = RetryPolicy()
+  return _shared_retry_policy
 
 
 class AsyncCSGRequest:
 
-  def __init__(self, api_key):
-    self.uri = 'https://csgapi.appspot.com/v1/'
-    self.token_uri = "https://medicare-school-quote-tool.herokuapp.com/api/csg_token"
+  def __init__(self,
+               api_key,
+               http2=None,
+               max_connections=None,
+               max_keepalive_connections=None,
+               keepalive_expiry=None,
+               limiter=None,
+               cache_path=None,
+               base_uri=None,
+               token_uri=None,
+               retry_policy=None,
+               memo_size=None,
+               transport=None,
+               probe_strategy=None,
+               checkpoint_path=None):
+    # base_uri / token_uri (or CSG_BASE_URI / CSG_TOKEN_URI) point the client
+    # at another server, e.g. the csg_stub.py stand-in
+    self.uri = base_uri or Config.CSG_BASE_URI or 'https://csgapi.appspot.com/v1/'
+    self.token_uri = token_uri or Config.CSG_TOKEN_URI or "https://medicare-school-quote-tool.herokuapp.com/api/csg_token"
     self.api_key = api_key
     self.token = None  # Will be set asynchronously in an init method
     self.request_count = 0
+    self.limiter = limiter or shared_limiter()
+    self.retry_policy = retry_policy or shared_retry_policy()
+    cache_path = cache_path or Config.CSG_CACHE_PATH
+    self.cache = ResponseCache(cache_path) if cache_path else None
+    # per-process LRU behind load_response / load_response_all
+    self.memo = QuoteMemo(memo_size or Config.CSG_MEMO_SIZE)
+    # 'planned' (probe_planner) or 'random' order for region discovery probes
+    self.probe_strategy = probe_strategy or Config.CSG_PROBE_STRATEGY
+    # probe log that lets an interrupted mapping run resume (unset = off)
+    checkpoint_path = checkpoint_path or Config.CSG_CHECKPOINT_PATH
+    self.checkpoint = MappingCheckpoint(checkpoint_path) if checkpoint_path else None
+    self._inflight = {}
+    self._waiters = {}  # callers awaiting each in-flight call
+    self.coalesced = 0  # fetch_quote calls answered by an identical in-flight call
+
+    # one pooled client per instance, created lazily on first request
+    self.http2 = Config.CSG_HTTP2 if http2 is None else http2
+    self.limits = httpx.Limits(
+        max_connections=max_connections or Config.CSG_MAX_CONNECTIONS,
+        max_keepalive_connections=max_keepalive_connections or
+        Config.CSG_MAX_KEEPALIVE,
+        keepalive_expiry=keepalive_expiry or Config.CSG_KEEPALIVE_EXPIRY)
+    self.transport = transport  # e.g. httpx.ASGITransport(app=csg_stub.create_app())
+    self._client = None
+    self._client_loop = None
+    self.token_expires_at = None
+    self._token_lifetime = None  # from the last token response, if it had one
+    self._token_refresh = None
+    self._token_retry_after = 0.0
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc_info):
+    await self.aclose()
+
+  def _get_client(self):
+    loop = asyncio.get_running_loop()
+    # a client is bound to the loop it first ran on; scripts that call
+    # asyncio.run more than once get a fresh pool per loop
+    if self._client is None or self._client.is_closed or self._client_loop is not loop:
+      http2 = self.http2
+      if http2 and importlib.util.find_spec('h2') is None:
+        logging.warning("HTTP/2 requested but 'h2' is not installed; using HTTP/1.1")
+        http2 = False
+      self._client = httpx.AsyncClient(timeout=TIMEOUT,
+                                       limits=self.limits,
+                                       http2=http2,
+                                       transport=self.transport)
+      self._client_loop = loop
+    return self._client
+
+  async def aclose(self):
+    logging.info(f"CSG requests sent: {self.request_count}, coalesced: {self.coalesced}, "
+                 f"retry policy: {self.retry_policy.stats()}, memo: {self.memo.stats()}")
+    client, self._client = self._client, None
+    self._client_loop = None
+    if client is not None and not client.is_closed:
+      await client.aclose()
+    cache, self.cache = self.cache, None
+    if cache is not None:
+      cache.close()
+    checkpoint, self.checkpoint = self.checkpoint, None
+    if checkpoint is not None:
+      checkpoint.close()
 
   async def async_init(self):
     try:
-      await self.set_token(await self.parse_token('token.txt'))
+      await self.set_token(await self.parse_token('token.txt'),
+                           issued_at=os.path.getmtime('token.txt'))
     except Exception as e:
       print(f"Could not parse token file: {e}")
       await self.set_token()
@@ -111,8 +500,10 @@ class AsyncCSGRequest:
       parser.read_file(file)
     return parser.get('token-config', 'token')
 
-  async def set_token(self, token=None):
+  async def set_token(self, token=None, issued_at=None):
     self.token = token if token else await self.fetch_token()
+    self.token_expires_at = token_expiry(self.token, issued_at or time.time(),
+                                         None if token else self._token_lifetime)
     # Token is set, no need to write to a file unless it's a new token
     if not token:
       # Write the token to 'token.txt' asynchronously
@@ -120,12 +511,14 @@ class AsyncCSGRequest:
         f.write(f"[token-config]\ntoken={self.token}")
 
   async def fetch_token(self):
-    async with httpx.AsyncClient() as client:
-      resp = await client.get(self.token_uri)
+    resp = await self._get_client().get(self.token_uri)
     if resp.status_code == 200:
-      token = resp.json().get("csg_token")
+      body = resp.json()
+      token = body.get("csg_token")
       logging.info(f"Fetched_token is {token}")
+      self._token_lifetime = response_lifetime(body)
       await self.set_token(token)
+      self.token_expires_at = token_expiry(token, time.time(), self._token_lifetime)
       return token
     else:
       return await self.fetch_token_fallback()
@@ -133,52 +526,87 @@ class AsyncCSGRequest:
   async def fetch_token_fallback(self):
     ep = 'auth.json'
     values = {'api_key': self.api_key}
-    async with httpx.AsyncClient() as client:
-      resp = await client.post(self.uri + ep, json=values)
-      resp.raise_for_status(
-      )  # Will raise an exception for 4XX and 5XX status codes
-      token = resp.json()['token']
-      logging.warn(f"Reset token via csg: {token}")
-      return token
+    resp = await self._get_client().post(self.uri + ep, json=values)
+    resp.raise_for_status(
+    )  # Will raise an exception for 4XX and 5XX status codes
+    body = resp.json()
+    token = body['token']
+    self._token_lifetime = response_lifetime(body)
+    logging.warn(f"Reset token via csg: {token}")
+    return token
 
   def GET_headers(self):
     return {'Content-Type': 'application/json', 'x-api-token': self.token}
 
-  async def reset_token(self):
-    print('Resetting token asynchronously')
-    await self.set_token(token=None)
-
-  async def get(self, uri, params, full_response=False):
-    async with httpx.AsyncClient(timeout=10.0) as client:
-      resp = await client.get(uri, params=params, headers=self.GET_headers())
-      if resp.status_code == 403:
-        await self.reset_token()
-        resp = await client.get(uri, params=params, headers=self.GET_headers())
-      resp.raise_for_status(
-      )  # Will raise an exception for 4XX and 5XX status codes
-      self.request_count += 1
-      return resp.json() if not full_response else resp
+  async def reset_token(self, stale_token=None):
+    # Single-flight: every caller that saw the same stale token shares one
+    # refresh instead of each fetching (and writing token.txt) on its own.
+    if stale_token is not None and stale_token != self.token:
+      return  # already refreshed by someone else
+    await asyncio.shield(self._start_token_refresh())
+
+  def _start_token_refresh(self):
+    refresh = self._token_refresh
+    if refresh is None or refresh.get_loop() is not asyncio.get_running_loop():
+      print('Resetting token asynchronously')
+      refresh = asyncio.ensure_future(self.set_token(token=None))
+      refresh.add_done_callback(self._token_refresh_done)
+      self._token_refresh = refresh
+    return refresh
+
+  def _token_refresh_done(self, fut):
+    if self._token_refresh is fut:
+      self._token_refresh = None
+    if not fut.cancelled() and fut.exception() is not None:
+      logging.error(f"Token refresh failed: {fut.exception()}")
+      # hold off on proactive refreshes for a bit; a 401/403 still forces one
+      self._token_retry_after = time.time() + TOKEN_REFRESH_MARGIN / 4
+
+  async def ensure_fresh_token(self):
+    if self.token_expires_at is None:
+      return
+    remaining = self.token_expires_at - time.time()
+    if remaining <= 0:
+      await self.reset_token(self.token)
+    elif remaining <= TOKEN_REFRESH_MARGIN and time.time() >= self._token_retry_after:
+      # refresh in the background; the current token is still good meanwhile
+      self._start_token_refresh()
 
   async def get(self, uri, params, retry=3):
-    for _ in range(retry):  # Retry up to 3 times
-      try:
-        async with httpx.AsyncClient(
-            timeout=TIMEOUT) as client:  # Increase timeout
-          resp = await client.get(uri,
-                                  params=params,
-                                  headers=self.GET_headers())
-          if resp.status_code == 403:
-            await self.reset_token()
-            resp = await client.get(uri,
-                                    params=params,
-                                    headers=self.GET_headers())
-          resp.raise_for_status(
-          )  # Will raise an exception for 4XX and 5XX status codes
-          self.request_count += 1
-          return resp.json()
-      except ReadTimeout:
-        print("Request timed out. Retrying...")
-    raise Exception(f"Request failed after {retry} attempts")
+    return await self.retry_policy.run(self._get_once, uri, params, max_attempts=retry)
+
+  async def _get_once(self, uri, params):
+    client = self._get_client()
+    await self.ensure_fresh_token()
+    token = self.token
+    resp = await self._send(client, uri, params)
+    if resp.status_code in (401, 403):
+      await self.reset_token(token)
+      resp = await self._send(client, uri, params)
+    resp.raise_for_status(
+    )  # Will raise an exception for 4XX and 5XX status codes
+    self.request_count += 1
+    return resp.json()
+
+  async def _send(self, client, uri, params):
+    # pace through the shared limiter and feed the outcome to it and the breaker
+    await self.limiter.acquire()
+    breaker = self.retry_policy.breaker
+    start = time.monotonic()
+    try:
+      resp = await client.get(uri, params=params, headers=self.GET_headers())
+    except httpx.TransportError as e:
+      if isinstance(e, httpx.TimeoutException):
+        self.limiter.record_failure()
+      breaker.record_failure()
+      raise
+    if resp.status_code == 429 or resp.status_code >= 500:
+      self.limiter.record_failure()
+      breaker.record_failure()
+    else:
+      self.limiter.record_success(time.monotonic() - start)
+      breaker.record_success()
+    return resp
 
   async def _fetch_pdp(self, zip5):
     ep = 'medicare_advantage/quotes.json'
@@ -225,26 +653,67 @@ class AsyncCSGRequest:
     fout = filter(lambda x: x['year'] in years, out)
     return list(fout)
 
-  async def fetch_quote(self, **kwargs):
+  def quote_payload(self, query_data):
     acceptable_args = [
         'zip5', 'county', 'age', 'gender', 'tobacco', 'plan', 'select',
         'effective_date', 'apply_discounts', 'apply_fees', 'offset', 'naic'
     ]
     payload = {}
-
-    if 'retry' in kwargs:
-      retry = kwargs.pop('retry')
-    else:
-      retry = 3
-
-    for arg_name, val in kwargs.items():
+    for arg_name, val in query_data.items():
       lowarg = arg_name.lower()
       if lowarg in acceptable_args:
         payload[lowarg] = val
     payload['apply_discounts'] = int(payload.get('apply_discounts', 0))
+    return payload
+
+  async def fetch_quote(self, **kwargs):
+    retry = kwargs.pop('retry', 3)
+    payload = self.quote_payload(kwargs)
+
+    if self.cache is not None:
+      cached = self.cache.get(payload)
+      if cached is not None:
+        return cached
+
+    # identical concurrent requests share one in-flight call
+    key = payload_key(payload)
+    pending = self._inflight.get(key)
+    if pending is not None and pending.get_loop() is asyncio.get_running_loop():
+      self.coalesced += 1
+      return deepcopy(await self._await_shared(key, pending))
+    pending = asyncio.ensure_future(self._fetch_quote(payload, retry))
+    self._inflight[key] = pending
+    pending.add_done_callback(lambda f: self._inflight_done(key, f))
+    return await self._await_shared(key, pending)
+
+  async def _await_shared(self, key, pending):
+    self._waiters[key] = self._waiters.get(key, 0) + 1
+    try:
+      return await asyncio.shield(pending)
+    except asyncio.CancelledError:
+      # the last caller gave up (e.g. a hedged fetch that lost the race):
+      # stop the call instead of letting it retry for nobody
+      if self._waiters.get(key) == 1 and not pending.done():
+        pending.cancel()
+      raise
+    finally:
+      waiters = self._waiters.get(key, 1) - 1
+      if waiters > 0:
+        self._waiters[key] = waiters
+      else:
+        self._waiters.pop(key, None)
 
+  def _inflight_done(self, key, fut):
+    if self._inflight.get(key) is fut:
+      del self._inflight[key]
+    if not fut.cancelled():
+      fut.exception()  # retrieved here so an abandoned call doesn't warn
+
+  async def _fetch_quote(self, payload, retry):
     ep = 'med_supp/quotes.json'
     resp = await self.get(self.uri + ep, params=payload, retry=retry)
+    if self.cache is not None:
+      self.cache.put(payload, resp)
     return resp
 
   async def fetch_advantage(self, **kwargs):
@@ -268,6 +737,7 @@ class AsyncCSGRequest:
 
   @rate_limited(3600)
   def format_rates(self, quotes, household):
+    categories = get_carrier_categories()
     dic = {}
     for i, q in enumerate(quotes):
       rate = int(q['rate']['month'])
@@ -292,24 +762,15 @@ class AsyncCSGRequest:
       cat = 2
       disp = kk
 
-      name_dict = csv_to_dict('cat.csv')
-
-      ddic = name_dict.get(naic)
+      ddic = categories.get(naic)
       if ddic:
-        sub = False
-        i = 1
-        while i < 10:
-          s = str(i)
-          if ddic.get(s):
-            sval = ddic[s]
-            if sval.lower() in kk.lower():
-              naic = f"{naic}00{s}"
-              disp = f"{ddic.get('Name')} // {ddic.get(s, '').capitalize()}"
-              cat = 1
-              sub = True
-              break
-          i += 1
-        if not sub:
+        sub = categories.match_sub(naic, kk)
+        if sub:
+          s, sval = sub
+          naic = f"{naic}00{s}"
+          disp = f"{ddic.get('Name')} // {sval.capitalize()}"
+          cat = 1
+        else:
           cat = ddic.get("Category", 2)
           disp = ddic.get("Name", kk)
 
@@ -404,39 +865,61 @@ class AsyncCSGRequest:
         plan_dict[plan] = arr
     return plan_dict
 
-  async def load_response_inner(self, query_data, delay=None):
+  async def load_response_inner(self, query_data, delay=None, retry=4):
     if delay:
       await asyncio.sleep(delay)
       print("Sleeiping ", delay)
-    resp = await self.fetch_quote(**query_data, retry=4)
+    resp = await self.fetch_quote(**query_data, retry=retry)
     return resp
 
   async def load_response_all_inner(self, query_data, delay=None):
-    results = {}
-    plans_ = query_data.pop('plan')
-    tasks = []
-    p_actual = []
-    for p in ['A', 'B', 'C', 'D', 'F', 'G', 'HDF', 'HDG', 'K', 'L', 'M', 'N']:
-      if p in plans_:
-        p_actual.append(p)
-    for i, p in enumerate(p_actual):
-      qu = copy(query_data)
+    query = dict(query_data)
+    plans_ = query.pop('plan')
+
+    async def load_plan(p):
+      qu = copy(query)
       qu['plan'] = p
-      tasks.append(self.load_response_inner(qu, delay))
+      return p, await self.load_response_inner(qu, delay)
 
+    results = {}
+    tasks = [load_plan(p) for p in MEDSUPP_PLANS if p in plans_]
     for task in asyncio.as_completed(tasks):
-      result = await task
-      results.update(result)
+      p, result = await task
+      results[p] = result
 
     return results  # self.format_results(results)
 
-  @cached(ttl=36_000)
   async def load_response_all(self, query_data, delay=None):
-    return await self.load_response_all_inner(query_data, delay=delay)
+    """Quotes for every plan in query_data['plan'], keyed by plan.
+
+    Plans already in the memo are served from it; only the rest are fetched.
+    """
+    query = dict(query_data)
+    plans_ = query.pop('plan')
+    results = {}
+    missing = []
+    for p in MEDSUPP_PLANS:
+      if p in plans_:
+        hit = self.memo.get(self.quote_payload({**query, 'plan': p}))
+        if hit is None:
+          missing.append(p)
+        else:
+          results[p] = hit
+    if missing:
+      fetched = await self.load_response_all_inner({**query, 'plan': missing}, delay=delay)
+      for p, resp in fetched.items():
+        self.memo.put(self.quote_payload({**query, 'plan': p}), resp)
+        results[p] = resp
+    return {p: results[p] for p in MEDSUPP_PLANS if p in results}
 
-  @cached(ttl=36_000)
   async def load_response(self, query_data, delay=None):
-    return await self.load_response_inner(query_data, delay=delay)
+    payload = self.quote_payload(query_data)
+    hit = self.memo.get(payload)
+    if hit is not None:
+      return hit
+    resp = await self.load_response_inner(query_data, delay=delay)
+    self.memo.put(payload, resp)
+    return resp
 
   async def get_companies(self):
     uri = self.uri + "medicare_advantage/open/companies.json"
@@ -444,8 +927,8 @@ class AsyncCSGRequest:
     return resp
 
   async def calc_counties(self, state):
-    zips = zipHolder('static/uszips.csv')
-    state_zips = [k for (k, v) in zips.zip_states.items() if v == state]
+    zips = get_zip_holder()
+    state_zips = zips.lookup_zips_by_state(state)
     state_zip_county = []
 
     for z in state_zips:
@@ -502,8 +985,8 @@ class AsyncCSGRequest:
     return out, stats
 
   async def calc_counties2(self, state):
-    zips = zipHolder('static/uszips.csv')
-    state_zips = [k for (k, v) in zips.zip_states.items() if v == state]
+    zips = get_zip_holder()
+    state_zips = zips.lookup_zips_by_state(state)
     state_zip_county = []
 
     for z in state_zips:
@@ -559,14 +1042,92 @@ class AsyncCSGRequest:
 
     return lookup_list
     
-  async def calc_naic_map_zip(self, state, naic, first_result=None):
+  def mapping_run(self, state, naic, effective_date):
+    """Probe log for a mapping run, or None when checkpointing is off."""
+    return self.checkpoint.run(state, naic, effective_date) if self.checkpoint else None
+
+  def clear_mapping_run(self, state, naic):
+    """Drop a carrier's probe log once its mapping has been saved."""
+    if self.checkpoint is not None:
+      self.checkpoint.clear(state, naic)
+
+  async def probe_quote(self, run, params):
+    """fetch_quote for a mapping probe, replayed from / logged to run."""
+    if run is None:
+      return await self.fetch_quote(**params)
+    key = probe_key(params)
+    rr = run.get(key)
+    if rr is None:
+      rr = await self.fetch_quote(**params)
+      run.record(key, rr)
+    return rr
+
+  def resume_order(self, run, items):
+    """Logged items of `items` in probe order, so a resume replays them first."""
+    if run is None:
+      return []
+    items = set(items)
+    return [z for z in run.zips() if z in items]
+
+  async def explore(self, items, visit, skip, concurrency=None, more=None):
+    """Run visit(item) over items in order, skipping those skip() already covers.
+
+    Up to `concurrency` visits are in flight at once (all still paced by the
+    shared limiter). Whenever one lands, in-flight visits whose item it
+    covered are cancelled. Returns False if a visit returned False to abort.
+    items is read lazily, one item per free slot, so a ProbePlanner sees
+    every result that landed before it picks the next probe. Visits may
+    append to the deque `more`, which is drained ahead of items; we finish
+    once both are empty and nothing is in flight.
+    """
+    concurrency = concurrency or Config.CSG_MAP_CONCURRENCY
+    pending = iter(items)
+    more = deque() if more is None else more
+
+    def next_item():
+      if more:
+        return more.popleft()
+      return next(pending, _DONE)
+
+    if concurrency <= 1:
+      while True:
+        item = next_item()
+        if item is _DONE:
+          return True
+        if not skip(item) and await visit(item) is False:
+          return False
+
+    inflight = {}
+    try:
+      while True:
+        while len(inflight) < concurrency:
+          item = next_item()
+          if item is _DONE:
+            break
+          if not skip(item):
+            inflight[asyncio.ensure_future(visit(item))] = item
+        if not inflight:
+          return True
+        done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+          inflight.pop(task)
+          if not task.cancelled() and task.result() is False:
+            return False
+        for task, item in inflight.items():
+          if skip(item):
+            task.cancel()  # landed inside a region found meanwhile
+    finally:
+      for task in inflight:
+        task.cancel()
+
+  async def calc_naic_map_zip(self, state, naic, first_result=None, concurrency=None):
     if state == 'WY' and naic == '82538': # workaround for weirdness
       logging.warn(f"{naic} skipped by workaround")
       return []
-    zips = zipHolder('static/uszips.csv')
-    state_zips = [k for (k, v) in zips.zip_states.items() if v == state]
+    zips = get_zip_holder()
+    state_zips = zips.lookup_zips_by_state(state)
 
-    lookup_list = []
+    regions = RegionRegistry()
     processed_zips = set()
 
     zero_count = 0
@@ -583,54 +1144,60 @@ class AsyncCSGRequest:
     if state not in ['MN', 'WI', 'MA', 'NY']:
       params["plan"] = "G"
 
-    first_result = await self.fetch_quote(**params) if first_result is None else first_result 
+    run = self.mapping_run(state, naic, params['effective_date'])
+    resume = self.resume_order(run, state_zips)
+    if resume:
+      params['zip5'] = resume[0]
+
+    first_result = await self.probe_quote(run, params) if first_result is None else first_result 
     if len(first_result) == 0:
       logging.warn(f"No results for {naic} in {state}. The plan may not be offered in this state.")
       return []
     else:
       zbase = set(first_result[0]['location_base']['zip5'])
       logging.info(f"{len(zbase)} zips for {naic}")
-      lookup_list.append(zbase)
+      regions.add(zbase)
       processed_zips.update(zbase)
 
-    for z in state_zips:
-      if z not in processed_zips:
-        try:
-          params['zip5'] = z
-          rr = await self.fetch_quote(**params)
-          if len(rr) > 0:
-            x = rr[0]
-            zbase = set(x['location_base']['zip5'])
-            logging.info(f"{len(zbase)} zips for {naic}")
-            
-            # Check if zbase is already in lookup_list
-            existing_index = next((i for i, existing_zbase in enumerate(lookup_list) if existing_zbase == zbase), None)
-            if existing_index is not None:
-                # Replace existing zbase
-                zbase.add(z)
-                lookup_list[existing_index] = zbase
-            else:
-                # Append new zbase
-                zbase.add(z)
-                lookup_list.append(zbase)
+    async def visit(z):
+      nonlocal zero_count
+      try:
+        rr = await self.probe_quote(run, {**params, 'zip5': z})
+        if len(rr) > 0:
+          x = rr[0]
+          zbase = set(x['location_base']['zip5'])
+          logging.info(f"{len(zbase)} zips for {naic}")
+          
+          # Merge into the matching region, or start a new one
+          zbase = regions.regions[regions.add(zbase, z)]
 
-            processed_zips.update(zbase)
+          processed_zips.update(zbase)
 
-            if len(zbase) == 0:
-              zero_count += 1
-              if zero_count > 30:
-                logging.warn(f"{naic} has {zero_count} zero regions -- exiting")
-                return []
-          else:
-            logging.warn(f"No results for {z}")
-        except Exception as ee:
-          logging.warn(f"No results for {z} -- {ee}")
+          if len(zbase) == 0:
+            zero_count += 1
+            if zero_count > 30:
+              logging.warn(f"{naic} has {zero_count} zero regions -- exiting")
+              return False
+        else:
+          logging.warn(f"No results for {z}")
+      except Exception as ee:
+        logging.warn(f"No results for {z} -- {ee}")
+
+    covered = lambda z: z in processed_zips
+    if self.probe_strategy == 'random':
+      order = state_zips
+    else:
+      order = ProbePlanner(state_zips, zip_groups(zips, state_zips), covered)
+    if not await self.explore(chain(resume, order), visit, covered, concurrency):
+      return []
 
-    logging.info(f"{naic} has {len(lookup_list)} zip regions")
+    logging.info(f"{naic} has {len(regions)} zip regions -- {regions.stats()}")
+    if run is not None and run.replayed:
+      logging.info(f"{naic}: {run.replayed} probes replayed from the mapping checkpoint")
 
-    return lookup_list
+    return regions.regions
   
-  async def calc_humana_workaround(self, state_counties, sc_dict, processed_counties, params, zips, list_of_groups):
+  async def calc_humana_workaround(self, state_counties, sc_dict, processed_counties, params, zips, list_of_groups, run=None):
     group_extra = set()
     p_state_counties = process_st(state_counties)
 
@@ -650,7 +1217,7 @@ class AsyncCSGRequest:
           elif 'county' in params:
             params.pop('county')
           
-          rr = await self.fetch_quote(**params)
+          rr = await self.probe_quote(run, params)
           
           if len(rr) > 0:
             x = rr[0]
@@ -672,37 +1239,20 @@ class AsyncCSGRequest:
     return list_of_groups + [group_extra]
   
   
-  async def calc_naic_map_county(self, state, naic, first_result=None):
+  async def calc_naic_map_county(self, state, naic, first_result=None, concurrency=None):
     if state == 'WY' and naic == '82538':  # workaround for weirdness
         logging.warn(f"{naic} skipped by workaround")
         return []
 
-    zips = zipHolder('static/uszips.csv')
-    state_zips = [k for (k, v) in zips.zip_states.items() if v == state]
-    state_counties = set()
-
-    single_county_zips = set()
-    sc_dict = {}
-
-    for z in state_zips:
-        counties = zips.lookup_county2(z)
-        state_counties.update(counties)
-        if len(counties) == 1:
-            single_county_zips.add(z)
-            zz = sc_dict.get(counties[0], [])
-            zz.append(z)
-            sc_dict[counties[0]] = zz
-
-    
-
+    zips = get_zip_holder()
+    state_zips = zips.lookup_zips_by_state(state)
+    state_counties = zips.lookup_counties_by_state(state)
+    sc_dict = zips.lookup_single_county_zips(state)
 
     # Shuffle the single_county_zips list
-    single_county_zips = list(single_county_zips)
+    single_county_zips = [z for zs in sc_dict.values() for z in zs]
     random.shuffle(single_county_zips)
 
-    state_counties.discard('None')
-    state_counties.discard(None)
-
     # Log counties that aren't keys in sc_dict
     counties_not_in_sc_dict = state_counties - set(sc_dict.keys())
     for county in counties_not_in_sc_dict:
@@ -713,7 +1263,7 @@ class AsyncCSGRequest:
 
     zero_count = 0
 
-    lookup_list = []
+    regions = RegionRegistry()
 
     params = {
       "zip5": single_county_zips[0],
@@ -726,7 +1276,14 @@ class AsyncCSGRequest:
     if state not in ['MN', 'WI', 'MA', 'NY']:
       params["plan"] = "G"
 
-    first_result = await self.fetch_quote(**params) if first_result is None else first_result 
+    # a county is probed through its first 1:1 zip, so logged zips map back to counties
+    run = self.mapping_run(state, naic, params['effective_date'])
+    county_of = {zs[0]: c for c, zs in sc_dict.items() if zs}
+    resume = [county_of[z] for z in self.resume_order(run, county_of)]
+    if resume:
+      params['zip5'] = sc_dict[resume[0]][0]
+
+    first_result = await self.probe_quote(run, params) if first_result is None else first_result 
     
     city_items = set()
     if len(first_result) == 0:
@@ -753,7 +1310,7 @@ class AsyncCSGRequest:
       
       county_base = process_st(county_base_raw)
 
-      lookup_list.append(county_base)
+      regions.add(county_base)
       processed_counties.update(county_base)
       logging.info(f"{len(processed_counties)} counties processed for {naic}")
 
@@ -770,11 +1327,11 @@ class AsyncCSGRequest:
           'ST. TAMMANY',
           'WASHINGTON',
         ])
-        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1])
+        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1], run)
       
       # workaround for HUMANA AL
       if state in ['AL', 'MD', 'AK'] and naic in ['73288', '60984', '60052', '88595', '60219']:
-        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [])
+        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [], run)
       
       if state == 'TX' and naic in ['73288', '60984', '60052', '88595', '60219']:
         group1 = set([
@@ -791,7 +1348,7 @@ class AsyncCSGRequest:
             'RED RIVER', 'REEVES', 'REFUGIO', 'ROCKWALL', 'SAN PATRICIO', 'TITUS', 'UPTON', 'VAN ZANDT', 
             'VICTORIA', 'WARD', 'WILSON', 'WINKLER', 'WOOD'
         ])
-        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1, group2])
+        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1, group2], run)
 
       if state == 'IL' and naic in ['73288', '60984', '60052', '88595', '60219']:
         group1 = set([
@@ -803,7 +1360,7 @@ class AsyncCSGRequest:
           'JERSEY', 'KANKAKEE', 'MACOUPIN', 'MADISON', 'MONROE', 'MONTGOMERY', 
           'PERRY', 'RANDOLPH', 'ST. CLAIR', 'WASHINGTON'
         ])
-        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1, group2])
+        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1, group2], run)
       
       # workaround for HUMANA MO
       if state == 'MO' and naic in ['73288', '60984', '60052', '88595', '60219']:
@@ -820,7 +1377,7 @@ class AsyncCSGRequest:
             'PUTNAM', 'RALLS', 'ST. CLAIR', 'ST. FRANCOIS', 'STE. GENEVIEVE',
             'SCOTLAND', 'SULLIVAN', 'TANEY', 'WARREN', 'WASHINGTON',
         ])
-        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1, group2])
+        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1, group2], run)
       # workaround for HUMANA FL
       if state == 'FL' and naic in ['73288', '60984', '60052', '88595', '60219']:
         group1 = set([
@@ -855,7 +1412,7 @@ class AsyncCSGRequest:
           'SEMINOLE',
           'VOLUSIA'
         ])
-        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1, group2])
+        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1, group2], run)
       
       if state == 'MI' and naic in ['73288', '60984', '60052', '88595', '60219']:
         return []
@@ -894,75 +1451,82 @@ class AsyncCSGRequest:
           'TUSCOLA',
           'WASHTENAW'
         ])
-        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1, group2])
+        return await self.calc_humana_workaround(state_counties, sc_dict, processed_counties, params, zips, [group1, group2], run)
       
-      for county in state_counties:
-        if county not in processed_counties and county not in city_items:
-            logging.info(f"Processing county: {county}")
-            try:
-                # Find a zip code for this county
-                county_zip = next(z for z in sc_dict.get(county, []))
-                logging.info(f"county_zip: {county_zip}")
-                params['zip5'] = county_zip
-
-                if county_zip is None:
-                  logging.warn(f"No 1:1 zip code found for county: {county}")
-                  zip_to_use = zips.lookup_zip(county)
-                  params['zip5'] = zip_to_use
-                  params['county'] = county
-                elif 'county' in params:
-                  params.pop('county')
-                
-                rr = await self.fetch_quote(**params)
-                
-                if len(rr) > 0:
-                    x = rr[0]
-                    county_base_raw = set(x['location_base']['county'])
-                    if state == 'LA':
-                      county_base_raw = process_st(county_base_raw)
-
-                    cbr_i = list(county_base_raw)
-                    for x in cbr_i:
-                      if x.endswith(' CITY'):
-                          city_items.add(x[:-5])
-                      if state == 'FL':
-                        if x == 'SAINT JOHNS':
-                          city_items.add(x)
-                          county_base_raw.add('ST. JOHNS')
-                        if x == 'SAINT LUCIE':
-                          city_items.add(x)
-                          county_base_raw.add('ST. LUCIE')
-
-                          
-                    county_base = county_base_raw - city_items
-
-                    logging.info(f"{len(county_base)} counties for {naic}")
-                    
-                    # Check if county_base is already in lookup_list
-                    existing_index = next((i for i, s in enumerate(lookup_list) if s == county_base), None)
-                    if existing_index is not None:
-                        # Replace the existing set with the new one
-                        county_base.add(county)
-                        lookup_list[existing_index] = county_base
-                    else:
-                        # If not found, append the new set
-                        county_base.add(county)
-                        lookup_list.append(county_base)
-                    
-                    processed_counties.update(county_base)
-                    logging.info(f"{len(processed_counties)} counties processed for {naic} -- {county}")
-                    
-                    if len(county_base) == 0:
-                        zero_count += 1
-                        if zero_count > 5:
-                            logging.warn(f"{naic} has {zero_count} zero regions -- exiting")
-                            return []
-                else:
-                    logging.warn(f"No results for {county_zip} - {county}")
-            except Exception as ee:
-                logging.warn(f"Error processing {county}: {ee}")
+      base_params = params
+
+      async def visit(county):
+        nonlocal zero_count
+        params = dict(base_params)  # each in-flight probe gets its own copy
+        logging.info(f"Processing county: {county}")
+        try:
+            # Find a zip code for this county
+            county_zip = next(z for z in sc_dict.get(county, []))
+            logging.info(f"county_zip: {county_zip}")
+            params['zip5'] = county_zip
+
+            if county_zip is None:
+              logging.warn(f"No 1:1 zip code found for county: {county}")
+              zip_to_use = zips.lookup_zip(county)
+              params['zip5'] = zip_to_use
+              params['county'] = county
+            elif 'county' in params:
+              params.pop('county')
+
+            rr = await self.probe_quote(run, params)
 
-    logging.info(f"{naic} has {len(lookup_list)} county regions")
+            if len(rr) > 0:
+                x = rr[0]
+                county_base_raw = set(x['location_base']['county'])
+                if state == 'LA':
+                  county_base_raw = process_st(county_base_raw)
+
+                cbr_i = list(county_base_raw)
+                for x in cbr_i:
+                  if x.endswith(' CITY'):
+                      city_items.add(x[:-5])
+                  if state == 'FL':
+                    if x == 'SAINT JOHNS':
+                      city_items.add(x)
+                      county_base_raw.add('ST. JOHNS')
+                    if x == 'SAINT LUCIE':
+                      city_items.add(x)
+                      county_base_raw.add('ST. LUCIE')
+
+
+                county_base = county_base_raw - city_items
+
+                logging.info(f"{len(county_base)} counties for {naic}")
+
+                # Merge into the matching region, or start a new one
+                county_base = regions.regions[regions.add(county_base, county)]
+
+                processed_counties.update(county_base)
+                logging.info(f"{len(processed_counties)} counties processed for {naic} -- {county}")
+
+                if len(county_base) == 0:
+                    zero_count += 1
+                    if zero_count > 5:
+                        logging.warn(f"{naic} has {zero_count} zero regions -- exiting")
+                        return False
+            else:
+                logging.warn(f"No results for {county_zip} - {county}")
+        except Exception as ee:
+            logging.warn(f"Error processing {county}: {ee}")
+
+      covered = lambda c: c in processed_counties or c in city_items
+      if self.probe_strategy == 'random':
+        # sorted first so a seeded shuffle repeats; set order depends on the hash seed
+        order = sorted(state_counties)
+        random.shuffle(order)
+      else:
+        order = ProbePlanner(state_counties, county_groups(zips, state_zips), covered)
+      if not await self.explore(chain(resume, order), visit, covered, concurrency):
+        return []
+
+    logging.info(f"{naic} has {len(regions)} county regions -- {regions.stats()}")
+    if run is not None and run.replayed:
+      logging.info(f"{naic}: {run.replayed} probes replayed from the mapping checkpoint")
 
     # Check for missing counties
     missing_counties = set(state_counties) - processed_counties
@@ -976,11 +1540,11 @@ class AsyncCSGRequest:
     if coverage_percentage < 95:
         logging.warn(f"Low coverage ({coverage_percentage:.2f}%) for NAIC {naic} in state {state}")
 
-    return lookup_list
+    return regions.regions
   
-  async def calc_naic_map_combined2(self, state, naic, effective_date = None):
-     zips = zipHolder('static/uszips.csv')
-     state_zips = [k for (k, v) in zips.zip_states.items() if v == state]
+  async def calc_naic_map_combined2(self, state, naic, effective_date = None, concurrency=None):
+     zips = get_zip_holder()
+     state_zips = zips.lookup_zips_by_state(state)
      random.shuffle(state_zips)
 
      if effective_date is None:
@@ -994,17 +1558,21 @@ class AsyncCSGRequest:
       "effective_date": effective_date,
       "naic": naic,
      }
+     run = self.mapping_run(state, naic, effective_date)
+     resume = self.resume_order(run, state_zips)
+     if resume:
+       params['zip5'] = resume[0]
 
      try:
-        first_result = await self.fetch_quote(**params)
+        first_result = await self.probe_quote(run, params)
         if len(first_result) == 0:
           logging.warn(f"No results for {naic} in {state}. The plan may not be offered in this state.")
           out = ([], None)
         elif len(first_result[0]['location_base']['zip5']) > 0:
-          res = await self.calc_naic_map_zip(state, naic, first_result)
+          res = await self.calc_naic_map_zip(state, naic, first_result, concurrency)
           out = (res, 'zip5') 
         elif len(first_result[0]['location_base']['county']) > 0:
-          res = await self.calc_naic_map_county(state, naic, first_result)
+          res = await self.calc_naic_map_county(state, naic, first_result, concurrency)
           out = (res, 'county')
         else:
           logging.warn(f"This state/naic does not support combined mapping: {state}/{naic}")
@@ -1016,19 +1584,295 @@ class AsyncCSGRequest:
      lookup_list = sorted(lookup_list0, key = len, reverse = True)
      return lookup_list, mapping_type
 
-  async def calc_naic_map_combined(self, state, naic):
-    zips = zipHolder('static/uszips.csv')
-    state_zips = [k for (k, v) in zips.zip_states.items() if v == state]
-    state_counties = set()
+  async def calc_family_maps(self, state, naics, effective_date=None):
+    """calc_naic_map_combined2 for each naic, mapping a carrier family once.
 
-    for z in state_zips:
-        counties = zips.lookup_county(z)
-        state_counties.update(counties)
+    The first member of each family is mapped in full; its siblings take
+    that result if verify_family_map agrees and are mapped themselves if not.
+    """
+    out = {}
+    for naic in naics:
+      if naic in out:
+        continue
+      out[naic] = await self.calc_naic_map_combined2(state, naic, effective_date)
+      siblings = [n for n in family_siblings(state, naic) if n in naics and n not in out]
+      lookup_list, mapping_type = out[naic]
+      agreed = set()
+      if siblings and lookup_list:
+        agreed = await self.verify_family_map(state, naic, siblings, lookup_list, mapping_type,
+                                              effective_date=effective_date)
+      for sib in siblings:
+        if sib in agreed:
+          out[sib] = ([set(r) for r in lookup_list], mapping_type)
+        else:
+          out[sib] = await self.calc_naic_map_combined2(state, sib, effective_date)
+    return out
+
+  async def verify_family_map(self, state, naic, siblings, lookup_list, mapping_type,
+                              probes=3, effective_date=None):
+    """Siblings whose quotes match naic's location_base at a few of its regions.
+
+    Probes are quotes without a naic, so one call answers for the whole
+    family. A sibling is accepted only if it was seen at least once and never
+    disagreed; locations where naic itself is missing prove nothing.
+    """
+    zips = get_zip_holder()
+    sc_dict = zips.lookup_single_county_zips(state) if mapping_type == 'county' else {}
+    locations = []
+    for region in sorted(lookup_list, key=len, reverse=True)[:probes]:
+      if mapping_type == 'zip5':
+        candidates = [z for z in region if zips.lookup_state2(z) == state]
+      else:
+        candidates = [z for c in region for z in sc_dict.get(c, [])]
+      if candidates:
+        locations.append(random.choice(candidates))
+
+    if effective_date is None:
+      effective_date = (datetime.now() + timedelta(days=32)).replace(day=1).strftime('%Y-%m-%d')
+    params = {
+      "age": 65,
+      "gender": "M",
+      "tobacco": 0,
+      "effective_date": effective_date,
+    }
+    if state not in ['MN', 'WI', 'MA', 'NY']:
+      params["plan"] = "G"
+
+    location_key = lambda x: (sorted(x['location_base']['zip5']), sorted(x['location_base']['county']))
+    agreed = set(siblings)
+    seen = set()
+    for z in locations:
+      try:
+        rr = await self.fetch_quote(zip5=z, **params)
+      except Exception as ee:
+        logging.warn(f"Family spot probe failed for {state} {z} -- {ee}")
+        continue
+      first = {}
+      for x in rr:
+        first.setdefault(x['company_base']['naic'], x)
+      if naic not in first:
+        continue
+      expected = location_key(first[naic])
+      for sib in list(agreed):
+        if sib not in first or location_key(first[sib]) != expected:
+          logging.info(f"{sib} disagrees with {naic} in {state} at {z}; mapping it separately")
+          agreed.discard(sib)
+        else:
+          seen.add(sib)
+    agreed &= seen
+    logging.info(f"{state}: {sorted(agreed)} reuse the {naic} map after {len(locations)} spot probes")
+    return agreed
+
+  async def calc_state_map_all(self, state, naics, effective_date=None):
+    """Map every carrier in `naics` from one shared sequence of probes.
+
+    Each probe is a quote without a naic, so one response carries every
+    carrier's location_base. A zip is probed only while some carrier still
+    has it (or its county) unaccounted for. Returns {naic: (lookup_list,
+    mapping_type)} in the same shape as calc_naic_map_combined2. Carriers
+    with per-state workarounds go through calc_naic_map_combined2.
+    """
+    naics = [str(n) for n in naics]
+    out = await self.calc_family_maps(state, [n for n in naics if needs_individual_map(state, n)],
+                                      effective_date)
+    pending = [n for n in naics if n not in out]
+    if not pending:
+      return out
+
+    zips = get_zip_holder()
+    state_zips = zips.lookup_zips_by_state(state)
+    # single-county zips first so county carriers resolve unambiguously
+    single = [z for z in state_zips if len(zips.lookup_county(z)) == 1]
+    multi = [z for z in state_zips if len(zips.lookup_county(z)) != 1]
+    random.shuffle(single)
+    random.shuffle(multi)
+
+    if effective_date is None:
+      effective_date = (datetime.now() + timedelta(days=32)).replace(day=1).strftime('%Y-%m-%d')
+    params = {
+      "age": 65,
+      "gender": "M",
+      "tobacco": 0,
+      "effective_date": effective_date,
+    }
+    if state not in ['MN', 'WI', 'MA', 'NY']:
+      params["plan"] = "G"
 
-    state_counties.discard('None')
-    state_counties = list(state_counties)
+    mapping_type = {}
+    regions = {n: RegionRegistry() for n in pending}
+    processed = {n: set() for n in pending}  # zips or counties accounted for
+    city_items = {n: set() for n in pending}
+    misses = {n: 0 for n in pending}
+    done = set()  # carriers with nothing left to learn
+    probes = 0
+
+    def covered(naic, z):
+      if mapping_type.get(naic) == 'county':
+        return all(c in processed[naic] or c in city_items[naic]
+                   for c in zips.lookup_county(z))
+      return z in processed[naic]
+
+    # no naic in these probes, so the log is shared by every carrier in the state
+    run = self.mapping_run(state, '*', effective_date)
+    for z in dict.fromkeys(chain(self.resume_order(run, state_zips), single, multi)):
+      open_naics = [n for n in pending if n not in done and not covered(n, z)]
+      if not open_naics:
+        continue
+      try:
+        rr = await self.probe_quote(run, {**params, 'zip5': z})
+      except Exception as ee:
+        logging.warn(f"No results for {z} -- {ee}")
+        continue
+      probes += 1
+
+      first = {}
+      for x in rr:
+        first.setdefault(x['company_base']['naic'], x)
+      for naic in open_naics:
+        x = first.get(naic)
+        if x is None:
+          # not offered at this location; nothing to learn from it
+          if naic not in mapping_type:
+            misses[naic] += 1
+            if misses[naic] >= 5:
+              done.add(naic)
+          elif mapping_type[naic] == 'county':
+            processed[naic].update(zips.lookup_county(z))
+          else:
+            processed[naic].add(z)
+          continue
+        if naic not in mapping_type:
+          if x['location_base']['zip5']:
+            mapping_type[naic] = 'zip5'
+          elif x['location_base']['county']:
+            mapping_type[naic] = 'county'
+          else:
+            mapping_type[naic] = None
+        if mapping_type[naic] == 'zip5':
+          base = set(x['location_base']['zip5'])
+          base.add(z)
+        elif mapping_type[naic] == 'county':
+          base = county_region(state, x['location_base']['county'], city_items[naic])
+          if len(zips.lookup_county(z)) == 1:
+            base.update(zips.lookup_county(z))
+        else:
+          done.add(naic)
+          continue
+        regions[naic].add(base)
+        processed[naic].update(base)
+
+    replayed = run.replayed if run is not None else 0
+    logging.info(f"{state}: mapped {len(pending)} carriers with {probes} shared probes ({replayed} replayed)")
+    for naic in pending:
+      if naic not in mapping_type:
+        logging.warn(f"No results for {naic} in {state}. The plan may not be offered in this state.")
+      elif mapping_type[naic] is None:
+        logging.warn(f"This state/naic does not support combined mapping: {state}/{naic}")
+      else:
+        logging.info(f"{naic} has {len(regions[naic])} {mapping_type[naic]} regions -- {regions[naic].stats()}")
+      lookup_list = sorted(regions[naic].regions, key=len, reverse=True) if mapping_type.get(naic) else []
+      out[naic] = (lookup_list, mapping_type.get(naic))
+    return out
+
+  async def patch_naic_map(self, state, naic, lookup_list, mapping_type, concurrency=None):
+    """Check a stored mapping with one probe per group and re-explore only what moved.
+
+    A group is unchanged when a probe inside it returns exactly that group.
+    Groups that split, merged or were touched by a changed region are
+    re-explored together; the rest are kept as they are. Returns the new
+    lookup_list and {'groups', 'changed', 'probes'}.
+    """
+    zips = get_zip_holder()
+    sc_dict = zips.lookup_single_county_zips(state) if mapping_type == 'county' else {}
+    stored = [set(g) for g in lookup_list]
+    group_of = {item: i for i, g in enumerate(stored) for item in g}
+    params = {
+      "age": 65,
+      "gender": "M",
+      "tobacco": 0,
+      "effective_date": (datetime.now() + timedelta(days=32)).replace(day=1).strftime('%Y-%m-%d'),
+      "naic": naic,
+    }
+    if state not in ['MN', 'WI', 'MA', 'NY']:
+      params["plan"] = "G"
+
+    city_items = set()
+    regions = RegionRegistry()
+    covered = set()
+    dirty = set()
+    frontier = deque()
+    probes = 0
+
+    def probe_zip(item):
+      if mapping_type == 'zip5':
+        return item
+      return next(iter(sc_dict.get(item, [])), None)
+
+    async def probe(item):
+      nonlocal probes
+      z = probe_zip(item)
+      if z is None:
+        return None
+      probes += 1
+      rr = await self.fetch_quote(**{**params, 'zip5': z})
+      if not rr:
+        return set()
+      if mapping_type == 'zip5':
+        return set(rr[0]['location_base']['zip5']) | {z}
+      return county_region(state, rr[0]['location_base']['county'], city_items) | {item}
+
+    def mark_dirty(i):
+      if i not in dirty:
+        dirty.add(i)
+        frontier.extend(stored[i])
+
+    def record(item, base):
+      regions.add(base)
+      covered.update(base)
+      for other in base:
+        if other in group_of:
+          mark_dirty(group_of[other])
+
+    # one probe per stored group
+    for i, group in enumerate(stored):
+      candidates = [item for item in group if probe_zip(item) is not None]
+      if not candidates:
+        continue
+      item = random.choice(candidates)
+      try:
+        base = await probe(item)
+      except Exception as ee:
+        logging.warn(f"Verify probe failed for {state}/{naic} at {item} -- {ee}")
+        continue
+      if base != group:
+        mark_dirty(i)
+        if base:
+          record(item, base)
+
+    # re-explore everything the changed groups touch; frontier grows as we go
+    async def visit(item):
+      try:
+        base = await probe(item)
+      except Exception as ee:
+        logging.warn(f"No results for {item} -- {ee}")
+        return
+      if base:
+        record(item, base)
+
+    await self.explore((), visit, lambda item: item in covered or item in city_items, concurrency, more=frontier)
+
+    kept = [g for i, g in enumerate(stored) if i not in dirty]
+    new_list = sorted(kept + regions.regions, key=len, reverse=True)
+    stats = {'groups': len(stored), 'changed': len(dirty), 'probes': probes}
+    logging.info(f"Verified {state}/{naic} mapping: {stats}")
+    return new_list, stats
 
-    lookup_list = []
+  async def calc_naic_map_combined(self, state, naic):
+    zips = get_zip_holder()
+    state_zips = zips.lookup_zips_by_state(state)
+    state_counties = list(zips.lookup_counties_by_state(state))
+
+    regions = RegionRegistry()
     processed_items = set()
     mapping_type = None
 
@@ -1066,7 +1910,7 @@ class AsyncCSGRequest:
                 pprint(quote_args)
                 rr = await self.fetch_quote(**quote_args)
             else:  # It's a county
-                initial_zip = next(z for z in state_zips if initial_item in zips.lookup_county(z))
+                initial_zip = zips.lookup_zip_by_county(state, initial_item)[0]
                 quote_args = {
                     "zip5": initial_zip,
                     "county": initial_item,
@@ -1094,7 +1938,7 @@ class AsyncCSGRequest:
 
                 base_items = x['location_base'][mapping_type]
                 logging.info(f"{len(base_items)} {mapping_type}s for {naic}")
-                lookup_list.append(base_items)
+                regions.add(base_items)
                 processed_items.update(base_items)
                 break  # We've successfully determined the mapping type, exit the loop
             else:
@@ -1143,7 +1987,7 @@ class AsyncCSGRequest:
                     #if naic == '25178' and categorize_county(item) == 'GENERAL_GROUP' and results['GENERAL_GROUP']:
                         #continue
                     
-                    county_zip = next(z for z in state_zips if item in zips.lookup_county(z))
+                    county_zip = zips.lookup_zip_by_county(state, item)[0]
                     if state in ['MN', 'WI', 'MA', 'NY']:
                         rr = await self.fetch_quote(zip5=county_zip,
                                                     county=item,
@@ -1174,7 +2018,7 @@ class AsyncCSGRequest:
                               if x.endswith(' CITY'):
                                   city_name = x[:-5]  # Remove ' CITY' from the end
                                   city_items.append(city_name)
-                        lookup_list.append(base_items)
+                        regions.add(base_items)
                         processed_items.update(base_items)
                         logging.info(f"{len(processed_items)} {mapping_type}s processed for {naic} -- {item}")
                     else:
@@ -1198,21 +2042,12 @@ class AsyncCSGRequest:
 
 
 
-    if not lookup_list:
+    if not regions:
         logging.warn(f"No data found for {naic} in {state}. The plan may not be offered in this state.")
         return [], None
-    # Remove duplicate sublists from lookup_list
-    unique_lookup_list = []
-    seen = set()
-    for sublist in lookup_list:
-        # Convert the sublist to a tuple so it can be hashed
-        sublist_tuple = tuple(sorted(sublist))
-        if sublist_tuple not in seen:
-            seen.add(sublist_tuple)
-            unique_lookup_list.append(sublist)
-
-    lookup_list = unique_lookup_list
-    logging.info(f"{naic} has {len(lookup_list)} {mapping_type} regions")
+    # duplicates were merged by the registry as they arrived
+    lookup_list = [list(r) for r in regions.regions]
+    logging.info(f"{naic} has {len(lookup_list)} {mapping_type} regions -- {regions.stats()}")
     return lookup_list, mapping_type
 
 def has_household2(xx):
@@ -1222,30 +2057,11 @@ def has_household2(xx):
     kk = x + ' // ' + rating_class
   else:
     kk = x
-  nm = kk.lower()
-  # Load name_dict from cat.csv
-  name_dict = csv_to_dict('cat.csv')
-
-  nm_list = set(
-      [x['Household'].lower() for x in name_dict.values() if x['Household']])
-  for x in nm_list:
-    if x in nm:
-      return True, kk
-  return False, kk
+  return get_carrier_categories().is_household(kk), kk
 
 
 def has_household(x):
-  kk = x["fullname"]
-  nm = kk.lower()
-  # Load name_dict from cat.csv
-  name_dict = csv_to_dict('cat.csv')
-
-  nm_list = set(
-      [x['Household'].lower() for x in name_dict.values() if x['Household']])
-  for x in nm_list:
-    if x in nm:
-      return True
-  return False
+  return get_carrier_categories().is_household(x["fullname"])
 
 
 # Example usage
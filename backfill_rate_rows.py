@@ -0,0 +1,41 @@
+import argparse
+import asyncio
+import logging
+from build_db_new import MedicareSupplementRateDB
+
+
+def setup_logging(quiet: bool) -> None:
+    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    root_logger = logging.getLogger()
+    root_logger.handlers.clear()
+    root_logger.setLevel(logging.INFO)
+    if not quiet:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(logging.Formatter(log_format))
+        root_logger.addHandler(console_handler)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fill the rate_row table from existing rate_store blobs")
+    parser.add_argument("-d", "--db", type=str, required=True, help="Database file path")
+    parser.add_argument("-s", "--state", nargs="+", help="Only these states (default: all)")
+    parser.add_argument("-e", "--effective-date", type=str, help="Only this effective date (YYYY-MM-DD)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Suppress console output")
+    args = parser.parse_args()
+    setup_logging(args.quiet)
+
+    db = MedicareSupplementRateDB(db_path=args.db, log_operations=False)
+    try:
+        total = 0
+        for state in args.state or [None]:
+            written = db.backfill_rate_rows(state, args.effective_date)
+            logging.info(f"{state or 'all states'}: {written} rate rows written")
+            total += written
+        logging.info(f"Backfill complete: {total} rate rows")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
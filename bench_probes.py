@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# bench_probes.py
+"""Compare CSG calls per state for random vs planned mapping probe order.
+
+Runs calc_naic_map_combined2 in-process against csg_stub.py (no network)
+for each strategy, trial and level of probe concurrency:
+
+    python bench_probes.py -s SC TX --trials 5 -c 1 4 8
+    python bench_probes.py -s SC --replay csg_cache.db -n 60052 73288
+    python bench_probes.py -s SC TX --verify -c 1 4 8
+
+With --verify, each carrier's fresh mapping is made stale by shifting every
+cut between groups, the verify probe of all but the first group fails, and
+patch_naic_map must still cover every item at every level of concurrency.
+
+With --replay, responses recorded through --cache are served where the probe
+matches one exactly and synthesized otherwise; record with a mapping run in
+the same month so the effective dates line up.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import statistics
+
+import httpx
+
+from async_csg import AsyncCSGRequest, AdaptiveLimiter, RetryPolicy
+from csg_stub import SYNTHETIC_NAICS, create_app
+from zips import get_zip_holder
+
+STRATEGIES = ['random', 'planned']
+
+
+def recorded_naics(path, state, zip_holder):
+    conn = sqlite3.connect(path)
+    naics = set()
+    for payload, response in conn.execute('SELECT payload, response FROM csg_response'):
+        if zip_holder.lookup_state2(json.loads(payload).get('zip5', '')) != state:
+            continue
+        naics.update(q['company_base']['naic'] for q in json.loads(response))
+    conn.close()
+    return sorted(naics)
+
+
+async def map_state(app, state, naics, strategy, seed, concurrency):
+    cr = AsyncCSGRequest('bench', base_uri='http://stub/v1/', token_uri='http://stub/api/csg_token',
+                         transport=httpx.ASGITransport(app=app), probe_strategy=strategy,
+                         limiter=AdaptiveLimiter(rate=10_000, max_rate=10_000),
+                         retry_policy=RetryPolicy(base_delay=0.0))
+    await cr.fetch_token()
+    random.seed(seed)
+    before = app.state.stats['quotes']
+    regions = {}
+    for naic in naics:
+        lookup_list, mapping_type = await cr.calc_naic_map_combined2(state, naic, concurrency=concurrency)
+        regions[naic] = (mapping_type, sorted(sorted(r) for r in lookup_list))
+    calls = app.state.stats['quotes'] - before
+    await cr.aclose()
+    return calls, regions
+
+
+def stale_mapping(lookup_list):
+    """Move one item of every group into the group before it, as if each cut had shifted."""
+    groups = [set(g) for g in lookup_list]
+    for i in range(1, len(groups)):
+        if len(groups[i]) > 1:
+            moved = min(groups[i])
+            groups[i - 1].add(moved)
+            groups[i].discard(moved)
+    return groups
+
+
+def fail_first_probe(cr, zip_groups):
+    """Fail the first quote into every group but the first, so only re-exploring finds them moved."""
+    fetch_quote = cr.fetch_quote
+    failed = {0}
+
+    async def flaky(**params):
+        i = zip_groups.get(params.get('zip5'))
+        if i is not None and i not in failed:
+            failed.add(i)
+            raise httpx.ConnectError("injected verify failure")
+        return await fetch_quote(**params)
+    cr.fetch_quote = flaky
+
+
+async def verify_state(app, state, naics, seed, concurrency, zip_holder):
+    """(items a patched stale mapping covers, items the fresh mapping covers)."""
+    cr = AsyncCSGRequest('bench', base_uri='http://stub/v1/', token_uri='http://stub/api/csg_token',
+                         transport=httpx.ASGITransport(app=app),
+                         limiter=AdaptiveLimiter(rate=10_000, max_rate=10_000),
+                         retry_policy=RetryPolicy(base_delay=0.0))
+    await cr.fetch_token()
+    fetch_quote = cr.fetch_quote
+    sc_dict = zip_holder.lookup_single_county_zips(state)
+    random.seed(seed)
+    covered, expected = 0, 0
+    for naic in naics:
+        cr.fetch_quote = fetch_quote
+        lookup_list, mapping_type = await cr.calc_naic_map_combined2(state, naic, concurrency=1)
+        if not lookup_list:
+            continue
+        stale = stale_mapping(lookup_list)
+        zip_groups = {z: i for i, g in enumerate(stale) for item in g
+                      for z in ([item] if mapping_type == 'zip5' else sc_dict.get(item, []))}
+        fail_first_probe(cr, zip_groups)
+        patched, _ = await cr.patch_naic_map(state, naic, stale, mapping_type, concurrency=concurrency)
+        items = {item for g in lookup_list for item in g}
+        covered += len(items & {item for g in patched for item in g})
+        expected += len(items)
+    await cr.aclose()
+    return covered, expected
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark mapping probe strategies against csg_stub")
+    parser.add_argument("-s", "--state", nargs="+", required=True, help="States to map")
+    parser.add_argument("-n", "--naic", nargs="+", help="Carriers to map (default: all in the recording, or the synthetic set)")
+    parser.add_argument("--replay", type=str, help="ResponseCache file recorded with --cache")
+    parser.add_argument("--zips", type=str, default="static/uszips.csv")
+    parser.add_argument("--trials", type=int, default=3, help="Seeds per strategy")
+    parser.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 4], help="Probes in flight per carrier")
+    parser.add_argument("--verify", action="store_true", help="Check patch_naic_map restores a stale mapping instead")
+    parser.add_argument("--out", type=str, help="Write the report as JSON")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    zip_holder = get_zip_holder(args.zips)
+    app = create_app(replay=args.replay, zip_holder=zip_holder)
+
+    report = {}
+    for state in args.state:
+        if args.naic:
+            naics = args.naic
+        elif args.replay:
+            naics = recorded_naics(args.replay, state, zip_holder)
+        else:
+            naics = SYNTHETIC_NAICS
+        report[state] = {'naics': len(naics)}
+        if args.verify:
+            for concurrency in args.concurrency:
+                for seed in range(args.trials):
+                    covered, expected = await verify_state(app, state, naics, seed, concurrency, zip_holder)
+                    report[state][f"verify_{concurrency}_{seed}"] = {'covered': covered, 'expected': expected}
+                    print(f"{state}: {concurrency} in flight, seed {seed}: {covered}/{expected} items covered"
+                          f"{'' if covered == expected else ' -- MISSING ITEMS'}")
+            continue
+        for concurrency in args.concurrency:
+            row = {}
+            for strategy in STRATEGIES:
+                calls = []
+                for seed in range(args.trials):
+                    n, _ = await map_state(app, state, naics, strategy, seed, concurrency)
+                    calls.append(n)
+                row[strategy] = {'mean': round(statistics.mean(calls), 1), 'min': min(calls), 'max': max(calls)}
+            row['saved'] = f"{1 - row['planned']['mean'] / row['random']['mean']:.1%}" if row['random']['mean'] else 'n/a'
+            report[state][f"concurrency_{concurrency}"] = row
+            print(f"{state}: {len(naics)} carriers, {concurrency} in flight, calls random {row['random']['mean']} "
+                  f"vs planned {row['planned']['mean']} ({row['saved']} fewer)")
+
+    print(f"stub: {app.state.stats}")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,10 +1,9 @@
 # build_db_new.py
 import json
 from typing import List, Dict, Any
-from zips import zipHolder
-from async_csg import AsyncCSGRequest as csg
-from aiolimiter import AsyncLimiter
-from filter_utils import filter_quote
+from zips import get_zip_holder
+from async_csg import AsyncCSGRequest as csg, family_siblings, needs_individual_map
+from filter_utils import filter_quote, to_cents
 from config import Config
 from functools import reduce
 import asyncio
@@ -12,10 +11,12 @@ import csv
 import logging
 import itertools
 import random
+import time
 from copy import copy
 import operator
 from datetime import datetime, timedelta
 from db_operations_log import DBOperationsLogger
+from rate_writer import RateAccumulator, RateWriter, UPSERT_RATE_ROW, rate_blob, rate_rows, split_label, tobacco_flag
 from pprint import pprint
 # Configure logging
 logging.basicConfig(
@@ -28,17 +29,30 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class MedicareSupplementRateDB:
-    def __init__(self, db_path: str, log_operations: bool = True, log_file: str = None):
+    def __init__(self, db_path: str, log_operations: bool = True, log_file: str = None,
+                 cache_path: str = None, checkpoint_path: str = None):
         self.conn = libsql.connect(db_path)
-        self.cr = csg(Config.API_KEY)
+        self.cr = csg(Config.API_KEY, cache_path=cache_path, checkpoint_path=checkpoint_path)
         if log_operations:
             log_filename = log_file if log_file else f"db_operations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
             self.db_logger = DBOperationsLogger(log_filename)
         else:
             self.db_logger = None
         self._create_tables()
-        self.zip_holder = zipHolder("static/uszips.csv")
-        self.limiter = AsyncLimiter(max_rate=20, time_period=1)
+        # rate tasks queue their upserts; one writer batches them into transactions
+        self.rate_writer = RateWriter(self.conn, self.db_logger,
+                                      batch_size=Config.RATE_WRITE_BATCH,
+                                      max_delay=Config.RATE_WRITE_DELAY)
+        # merges each label's fragments so its row is written once per run
+        self.rate_accumulator = RateAccumulator(self.rate_writer, max_age=Config.RATE_MERGE_MAX_AGE)
+        self.age_requests = {}  # label -> {'chains', 'planned', 'sent'} while its tasks run
+        self.age_requests_total = {'planned': 0, 'sent': 0}
+        self.age_checks = {}  # (label, effective_date) -> future: did a derived age match a quote
+        self.age_curve_inconsistent = set()  # NAICs whose quotes don't follow their age_increases
+        self.fetch_latency = {}  # label -> seconds per fetch_helper call (hedged mode)
+        self.hedged = 0  # extra zips started because the first ones were slow
+        self.zip_holder = get_zip_holder()
+        self.limiter = self.cr.limiter  # adaptive, shared with every CSG caller
         self.default_parameters = {
             "age": 65,
             "gender": "M",
@@ -46,6 +60,17 @@ class MedicareSupplementRateDB:
             "tobacco": 0,
         }
 
+    async def close(self):
+        """Flush queued rate writes and release the CSG connection pool; call once when the run is done."""
+        self.rate_accumulator.flush()
+        logging.info(f"RateAccumulator: {self.rate_accumulator.stats()}")
+        total = self.age_requests_total
+        logging.info(f"Age requests: sent {total['sent']} of {total['planned']} planned "
+                     f"({total['planned'] - total['sent']} saved), {self.hedged} hedged zip requests")
+        await self.rate_writer.close()
+        logging.info(f"CSG limiter: {self.limiter.stats()}")
+        await self.cr.aclose()
+
     def _create_tables(self):
         cursor = self.conn.cursor()
         cursor.execute('''
@@ -77,6 +102,61 @@ class MedicareSupplementRateDB:
                 PRIMARY KEY (naic, state)
             )
         ''')
+        # copied-forward rates: each distinct value is stored once under its
+        # hash and (key, effective_date) rows point at it
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_blob (
+                hash TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_ref (
+                key TEXT,
+                effective_date TEXT,
+                hash TEXT,
+                PRIMARY KEY (key, effective_date)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rate_ref_hash
+            ON rate_ref(hash)
+        ''')
+        # every rate, stored or referenced; a rate_store row wins over a ref
+        cursor.execute('''
+            CREATE VIEW IF NOT EXISTS rate_store_all AS
+            SELECT key, effective_date, value FROM rate_store
+            UNION ALL
+            SELECT r.key, r.effective_date, b.value
+            FROM rate_ref r JOIN rate_blob b ON b.hash = r.hash
+            WHERE NOT EXISTS (
+                SELECT 1 FROM rate_store s
+                WHERE s.key = r.key AND s.effective_date = r.effective_date
+            )
+        ''')
+        # one row per rate cell, so a quote lookup is a point read instead of
+        # parsing the label's whole rate_store blob
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_row (
+                state TEXT,
+                naic TEXT,
+                naic_group INTEGER,
+                effective_date TEXT,
+                plan TEXT,
+                gender TEXT,
+                tobacco INTEGER,
+                age INTEGER,
+                rate_cents INTEGER,
+                discount_rate_cents INTEGER,
+                PRIMARY KEY (state, naic, naic_group, effective_date, plan, gender, tobacco, age)
+            ) WITHOUT ROWID
+        ''')
+        # covering index for one cell across every carrier in a state
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rate_row_cell
+            ON rate_row(state, effective_date, plan, gender, tobacco, age, naic, naic_group,
+                        rate_cents, discount_rate_cents)
+        ''')
         self.conn.commit()
 
     def get_selected_carriers(self):
@@ -124,9 +204,226 @@ class MedicareSupplementRateDB:
             'DELETE FROM rate_store WHERE key LIKE ?',
             (key,)
         )
+        self._execute_and_log(
+            'DELETE FROM rate_ref WHERE key LIKE ?',
+            (key,)
+        )
+        self._execute_and_log(
+            'DELETE FROM rate_row WHERE state = ? AND naic = ? AND naic_group = ?',
+            split_label(key)
+        )
+
+    def _replace_rate_rows(self, key: str, value: Dict[str, Any], effective_date: str):
+        # mirrors an INSERT OR REPLACE of the whole rate_store value
+        self._execute_and_log(
+            'DELETE FROM rate_row WHERE state = ? AND naic = ? AND naic_group = ? AND effective_date = ?',
+            (*split_label(key), effective_date)
+        )
+        rows = rate_rows(key, value, effective_date)
+        if rows:
+            self._execute_and_log(UPSERT_RATE_ROW, rows, many=True)
+
+    def _store_rate_ref(self, key: str, value: Dict[str, Any], effective_date: str):
+        """Set a rate by reference: the blob is written only if its hash is new."""
+        digest, doc = rate_blob(value)
+        self._execute_and_log(
+            'INSERT OR IGNORE INTO rate_blob (hash, value) VALUES (?, ?)',
+            (digest, doc)
+        )
+        self._execute_and_log(
+            'DELETE FROM rate_store WHERE key = ? AND effective_date = ?',
+            (key, effective_date)
+        )
+        self._execute_and_log(
+            'INSERT OR REPLACE INTO rate_ref (key, effective_date, hash) VALUES (?, ?, ?)',
+            (key, effective_date, digest)
+        )
+
+    def compact_rates(self, state: str = None, before_date: str = None, effective_date: str = None) -> int:
+        """Move rate_store rows into rate_blob/rate_ref and drop unreferenced blobs.
+
+        Only run this for dates no rate build is writing to; rate tasks
+        json_patch into rate_store. Returns the number of rows moved.
+        """
+        where, params = ['json_valid(value)'], []
+        if state:
+            where.append('key LIKE ?')
+            params.append(f"{state}:%")
+        if before_date:
+            where.append('effective_date < ?')
+            params.append(before_date)
+        if effective_date:
+            where.append('effective_date = ?')
+            params.append(effective_date)
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT key, effective_date, value FROM rate_store WHERE {' AND '.join(where)}",
+                       tuple(params))
+        rows = cursor.fetchall()
+        blobs, refs = {}, []
+        for key, effective_date, value in rows:
+            digest, doc = rate_blob(json.loads(value))
+            blobs[digest] = doc
+            refs.append((key, effective_date, digest))
+        if refs:
+            self._execute_and_log('INSERT OR IGNORE INTO rate_blob (hash, value) VALUES (?, ?)',
+                                  list(blobs.items()), many=True)
+            self._execute_and_log('INSERT OR REPLACE INTO rate_ref (key, effective_date, hash) VALUES (?, ?, ?)',
+                                  refs, many=True)
+            self._execute_and_log('DELETE FROM rate_store WHERE key = ? AND effective_date = ?',
+                                  [r[:2] for r in refs], many=True)
+        self._execute_and_log('DELETE FROM rate_blob WHERE hash NOT IN (SELECT hash FROM rate_ref)', ())
+        return len(refs)
+
+    def rate_storage_report(self) -> Dict[str, Any]:
+        """Bytes the referenced rates would take as plain rows vs what the blobs take."""
+        cursor = self.conn.cursor()
+        refs, logical = cursor.execute('''
+            SELECT COUNT(*), COALESCE(SUM(length(b.value)), 0)
+            FROM rate_ref r JOIN rate_blob b ON b.hash = r.hash
+        ''').fetchone()
+        blobs, stored = cursor.execute(
+            'SELECT COUNT(*), COALESCE(SUM(length(value)), 0) FROM rate_blob'
+        ).fetchone()
+        plain_rows, plain = cursor.execute(
+            'SELECT COUNT(*), COALESCE(SUM(length(value)), 0) FROM rate_store'
+        ).fetchone()
+        return {
+            'rate_store_rows': plain_rows,
+            'rate_store_bytes': plain,
+            'refs': refs,
+            'blobs': blobs,
+            'referenced_bytes': logical,
+            'blob_bytes': stored,
+            'saved_bytes': logical - stored,
+        }
+
+    def backfill_rate_rows(self, state: str = None, effective_date: str = None) -> int:
+        """Fill rate_row from existing rate_store blobs; returns rows written."""
+        where, params = [], []
+        if state:
+            where.append('key LIKE ?')
+            params.append(f"{state}:%")
+        if effective_date:
+            where.append('effective_date = ?')
+            params.append(effective_date)
+        self._execute_and_log(f'''
+            WITH blob AS (
+                SELECT
+                    substr(key, 1, instr(key, ':') - 1) AS state,
+                    substr(key, instr(key, ':') + 1) AS rest,
+                    effective_date,
+                    value
+                FROM rate_store_all
+                WHERE json_valid(value) {''.join(' AND ' + w for w in where)}
+            )
+            INSERT OR REPLACE INTO rate_row
+                (state, naic, naic_group, effective_date, plan, gender, tobacco, age,
+                 rate_cents, discount_rate_cents)
+            SELECT
+                blob.state,
+                substr(rest, 1, instr(rest, ':') - 1),
+                CAST(substr(rest, instr(rest, ':') + 1) AS INTEGER),
+                blob.effective_date,
+                json_extract(cell.value, '$.plan'),
+                json_extract(cell.value, '$.gender'),
+                CASE WHEN json_extract(cell.value, '$.tobacco') IN (1, '1', 'True', 'true') THEN 1 ELSE 0 END,
+                json_extract(cell.value, '$.age'),
+                CAST(round(json_extract(cell.value, '$.rate') * 100) AS INTEGER),
+                CAST(round(coalesce(json_extract(cell.value, '$.discount_rate'),
+                                    json_extract(cell.value, '$.rate')) * 100) AS INTEGER)
+            FROM blob, json_each(blob.value) AS cell
+            WHERE json_extract(cell.value, '$.rate') IS NOT NULL
+        ''', tuple(params))
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT changes()')
+        return cursor.fetchone()[0]
+
+    def _get_rate_cell(self, key: str, effective_date: str, age: int, gender: str, plan: str, tobacco) -> Any:
+        """One cell of a label's rates: a rate_row point read, or the blob if it isn't backfilled."""
+        cursor = self.conn.cursor()
+        row = cursor.execute('''
+            SELECT rate_cents, discount_rate_cents FROM rate_row
+            WHERE state = ? AND naic = ? AND naic_group = ? AND effective_date = ?
+            AND plan = ? AND gender = ? AND tobacco = ? AND age = ?
+        ''', (*split_label(key), effective_date, plan, gender, tobacco_flag(tobacco), age)).fetchone()
+        if row is not None:
+            return {'age': age, 'gender': gender, 'plan': plan, 'tobacco': tobacco,
+                    'rate': row[0] / 100, 'discount_rate': row[1] / 100, 'label': key}
+        stored = self._get_rate(key, effective_date)
+        return stored.get(f"{age}:{gender}:{plan}:{tobacco}") if stored else None
 
-    async def set_state_map_naic(self, naic: str, state: str):
+    async def set_state_map_naic(self, naic: str, state: str, reuse_family: bool = True):
+        if reuse_family and await self._copy_family_map(naic, state):
+            return True
         lookup_list, mapping_type = await self.cr.calc_naic_map_combined2(state, naic)
+        saved = self._save_state_map(naic, state, lookup_list, mapping_type)
+        self.cr.clear_mapping_run(state, naic)
+        return saved
+
+    async def verify_state_map_naic(self, naic: str, state: str) -> Dict[str, Any]:
+        """Patch a carrier's stored mapping in place of a full remap.
+
+        Probes each stored naic_group once and re-explores only the groups
+        that changed. Carriers with no stored mapping, or with hand-patched
+        groups that CSG can't confirm, get a full remap.
+        """
+        lookup_list, mapping_type = self._load_state_map(naic, state)
+        if not lookup_list or needs_individual_map(state, naic):
+            mapped = await self.set_state_map_naic(naic, state, reuse_family=False)
+            return {'state': state, 'naic': naic, 'remapped': True, 'mapping_result': mapped}
+        new_list, stats = await self.cr.patch_naic_map(state, naic, lookup_list, mapping_type)
+        if stats['changed']:
+            self._save_state_map(naic, state, new_list, mapping_type, replace=True)
+        return {'state': state, 'naic': naic, 'remapped': False, **stats}
+
+    def _load_state_map(self, naic: str, state: str):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT group_zip FROM group_type WHERE naic = ? AND state = ?
+        ''', (naic, state))
+        row = cursor.fetchone()
+        if row is None:
+            return [], None
+        cursor.execute('''
+            SELECT location, naic_group FROM group_mapping WHERE naic = ? AND state = ?
+        ''', (naic, state))
+        groups = {}
+        for location, naic_group in cursor.fetchall():
+            groups.setdefault(naic_group, set()).add(location)
+        lookup_list = [groups[g] for g in sorted(groups)]
+        return lookup_list, 'zip5' if row[0] else 'county'
+
+    async def _copy_family_map(self, naic: str, state: str) -> bool:
+        """Reuse a mapped sibling's regions if spot probes say they match."""
+        for sibling in family_siblings(state, naic):
+            lookup_list, mapping_type = self._load_state_map(sibling, state)
+            if not lookup_list:
+                continue
+            agreed = await self.cr.verify_family_map(state, sibling, [naic], lookup_list, mapping_type)
+            if naic in agreed:
+                logging.info(f"Copying {state}:{sibling} mapping to {naic}")
+                return self._save_state_map(naic, state, lookup_list, mapping_type, replace=True)
+            return False  # the family has split here; map it for real
+        return False
+
+    async def set_state_map_all(self, state: str, naics=None, replace: bool = False) -> Dict[str, bool]:
+        """Map many carriers in a state from one shared set of CSG probes.
+
+        Defaults to every carrier already mapped in the state. With replace,
+        a carrier's old group_mapping rows are dropped once its new map is in.
+        """
+        if naics is None:
+            naics = self.get_existing_naics(state)
+        maps = await self.cr.calc_state_map_all(state, sorted(naics))
+        saved = {
+            naic: self._save_state_map(naic, state, lookup_list, mapping_type, replace=replace)
+            for naic, (lookup_list, mapping_type) in maps.items()
+        }
+        for naic in ['*', *maps]:
+            self.cr.clear_mapping_run(state, naic)
+        return saved
+
+    def _save_state_map(self, naic: str, state: str, lookup_list, mapping_type, replace: bool = False):
         if len(lookup_list) == 0:
             return False
         
@@ -144,6 +441,8 @@ class MedicareSupplementRateDB:
 
         # Bulk insert group mappings
         cursor = self.conn.cursor()
+        if replace:
+            cursor.execute('DELETE FROM group_mapping WHERE naic = ? AND state = ?', (naic, state))
         if len(group_mapping_data) > 0:
             cursor.executemany('''
                 INSERT OR REPLACE INTO group_mapping (naic, state, location, naic_group)
@@ -204,8 +503,9 @@ class MedicareSupplementRateDB:
             plan_options = ['N', 'G', 'F']
         
 
-        additional_keys = ["tobacco", "age", "gender", "plan"]
-        additional_values = [tobacco_options, age_options, gender_options, plan_options]
+        # ages are walked inside each task, so a combination leaves age out
+        additional_keys = ["tobacco", "gender", "plan"]
+        additional_values = [tobacco_options, gender_options, plan_options]
         #naic = label.split(":")[1]
 
         #print(main_location)   
@@ -248,30 +548,117 @@ class MedicareSupplementRateDB:
         ]
 
         self._remove_rates(label)
+        self.rate_accumulator.expect(label, effective_date, len(combinations))
+        self.age_requests[label] = {'chains': len(combinations), 'planned': 0, 'sent': 0}
+        self.age_checks.pop((label, effective_date), None)
+        every_age = naic in self.age_curve_inconsistent
 
         for (i, combination) in enumerate(combinations):
             args = copy(args)
             cargs = copy(args)
             cargs.update(combination)
             arg_holder.append(cargs)
-            tasks.append(self.fetch_and_process_and_save(cargs, retry=10))
+            tasks.append(self.fetch_age_curve(cargs, age_options, retry=10, every_age=every_age))
 
         return tasks, arg_holder    
+
+    async def fetch_age_curve(self, cargs, ages, retry, every_age=False):
+        """Fetch one tobacco/gender/plan combination across `ages`.
+
+        process_quote expands each quote along its age_increases, so an age
+        is skipped when an earlier quote's curve (the shortest one returned)
+        already runs through its whole bucket, up to the next age on the
+        grid. every_age requests all of them.
+
+        The first chain of a label to skip an age requests it anyway and
+        compares it with the derived rates. On a mismatch every chain of the
+        label requests the ages it skipped, and later labels of the carrier
+        request every age.
+        """
+        label, effective_date = cargs['label'], cargs['effective_date']
+        out = []
+        sent = 0
+        reached = None
+        skipped = []
+
+        async def fetch(age):
+            nonlocal sent
+            args = copy(cargs)
+            args['age'] = age
+            fr, _ = await self.fetch_and_process(args, retry)
+            sent += 1
+            for ls in fr:
+                self._save_results(dic_build(ls), effective_date)
+            return fr
+
+        try:
+            for i, age in enumerate(ages):
+                step = ages[i + 1] - age if i + 1 < len(ages) else (age - ages[i - 1] if i else 1)
+                if not every_age and reached is not None and reached >= age + step - 1:
+                    skipped.append(age)
+                    continue
+                fr = await fetch(age)
+                curves = [max(q['age'] for q in ls) for ls in fr if ls]
+                if curves:
+                    reached = max(min(curves), reached or 0)
+                out.extend(fr)
+
+            if skipped:
+                key = (label, effective_date)
+                check = self.age_checks.get(key)
+                if check is None:
+                    # this chain spot-checks the label's first derived age
+                    check = self.age_checks[key] = asyncio.get_running_loop().create_future()
+                    age, skipped = skipped[0], skipped[1:]
+                    consistent = True
+                    try:
+                        fr = await fetch(age)
+                        consistent = age_curve_matches(out, fr, age)
+                        out.extend(fr)
+                    finally:
+                        check.set_result(consistent)
+                    if not consistent:
+                        naic = split_label(label)[1]
+                        logging.warning(f"{label}: quoted rates at age {age} don't follow age_increases; "
+                                        f"requesting every age for NAIC {naic}")
+                        self.age_curve_inconsistent.add(naic)
+                if not await asyncio.shield(check):
+                    for age in skipped:
+                        out.extend(await fetch(age))
+        finally:
+            self.rate_accumulator.done(label, effective_date)
+            self._count_age_requests(label, len(ages), sent)
+        return out, label
+
+    def _count_age_requests(self, label, planned, sent):
+        stats = self.age_requests.get(label)
+        if stats is None:
+            return
+        stats['planned'] += planned
+        stats['sent'] += sent
+        self.age_requests_total['planned'] += planned
+        self.age_requests_total['sent'] += sent
+        stats['chains'] -= 1
+        if stats['chains'] <= 0:
+            logging.info(f"{label}: sent {stats['sent']} of {stats['planned']} planned age requests "
+                         f"({stats['planned'] - stats['sent']} saved){latency_summary(self.fetch_latency.pop(label, []))}")
+            del self.age_requests[label]
     
     async def fetch_and_process(self, cargs, retry):
         results, label = await self.fetch_helper(cargs, retry)
         fr = [winnow_quotes(process_quote(q, label)) for q in results]
         return fr, label
     
-    async def fetch_and_process_and_save(self, cargs, retry):
-        fr, label = await self.fetch_and_process(cargs, retry)
-        for ls in fr:
-            dic = dic_build(ls)
-            #pprint(dic)
-            self._save_results(dic, cargs['effective_date'])
-        return fr, label
+    async def fetch_helper(self, args, retry=3, fallback_index=0, max_empty_attempts=5, hedge_delay=None):
+        hedge_delay = Config.CSG_HEDGE_DELAY if hedge_delay is None else hedge_delay
+        if hedge_delay > 0:
+            started = time.monotonic()
+            label = args['label']
+            try:
+                return await self.fetch_hedged(args, retry, max_empty_attempts, hedge_delay)
+            finally:
+                self.fetch_latency.setdefault(label, []).append(time.monotonic() - started)
 
-    async def fetch_helper(self, args, retry=3, fallback_index=0, max_empty_attempts=5):
         original_zip5 = args['zip5']
         zip5_fallback = args.pop('zip5_fallback')
         label = args.pop('label')
@@ -279,29 +666,20 @@ class MedicareSupplementRateDB:
         empty_results_count = 0  # Track number of empty results
 
         while fallback_index < len(zip5_fallback):
-            current_retry = retry
-            while current_retry > 0:
-                try:    
-                    async with self.limiter:
-                        results = await self.cr.load_response_inner(args)
-                        if results:  # If we got any results
-                            return results, label
-                        else:
-                            empty_results_count += 1
-                            logging.warning(f"No results for {args['zip5']}")
-                            if empty_results_count >= max_empty_attempts:
-                                logging.warning(f"Giving up after {max_empty_attempts} empty results for {label}")
-                                return [], label
-                            break  # Break inner loop to try next ZIP code
-                except Exception as e:
-                    logging.error(f"An error occurred for request: {args}")
-                    logging.error(f"Error details: {e}")
-                    if current_retry > 1:
-                        logging.info(f"Retrying request: {args} (Retry attempt: {11 - current_retry})")
-                        await asyncio.sleep(0.2)
-                        current_retry -= 1
-                    else:
-                        break
+            # transient errors are retried with backoff by the client's shared
+            # retry policy; anything that still fails moves on to the next zip
+            try:
+                results = await self.cr.load_response_inner(args, retry=retry)
+                if results:  # If we got any results
+                    return results, label
+                empty_results_count += 1
+                logging.warning(f"No results for {args['zip5']}")
+                if empty_results_count >= max_empty_attempts:
+                    logging.warning(f"Giving up after {max_empty_attempts} empty results for {label}")
+                    return [], label
+            except Exception as e:
+                logging.error(f"An error occurred for request: {args}")
+                logging.error(f"Error details: {e}")
             
             fallback_index += 1
             if fallback_index < len(zip5_fallback):
@@ -311,27 +689,67 @@ class MedicareSupplementRateDB:
         args['zip5'] = original_zip5
         logging.warning(f"All retry attempts and fallback locations exhausted for args: {args}")
         return [], label
+
+    async def fetch_hedged(self, args, retry, max_empty_attempts=5, hedge_delay=2.0, max_in_flight=2):
+        """fetch_helper racing the label's zips instead of trying them in turn.
+
+        The zips are the ones fetch_helper walks, in the same order. The next
+        zip starts when the current ones have been out for `hedge_delay`
+        seconds or one comes back empty or failed; the first non-empty
+        answer wins and the rest are cancelled. Every request still goes
+        through the client's shared limiter and retry policy.
+        """
+        fallback = args.pop('zip5_fallback')
+        # fetch_helper tries zip5, then zip5_fallback from its second entry on
+        zips = [args['zip5']] + fallback[1:] if fallback else []
+        label = args.pop('label')
+        pending = {}
+        empty_results_count = 0
+
+        def start_next():
+            if not zips or len(pending) >= max_in_flight:
+                return False
+            zargs = copy(args)
+            zargs['zip5'] = zips.pop(0)
+            pending[asyncio.ensure_future(self.cr.load_response_inner(zargs, retry=retry))] = zargs['zip5']
+            return True
+
+        start_next()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if start_next():
+                        self.hedged += 1
+                    continue
+                for task in done:
+                    zip5 = pending.pop(task)
+                    try:
+                        results = task.result()
+                    except Exception as e:
+                        logging.error(f"An error occurred for request: {args} at {zip5}")
+                        logging.error(f"Error details: {e}")
+                        start_next()
+                        continue
+                    if results:
+                        return results, label
+                    empty_results_count += 1
+                    logging.warning(f"No results for {zip5}")
+                    if empty_results_count >= max_empty_attempts:
+                        logging.warning(f"Giving up after {max_empty_attempts} empty results for {label}")
+                        return [], label
+                    start_next()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        logging.warning(f"All retry attempts and fallback locations exhausted for args: {args}")
+        return [], label
     
     def _save_results(self, dic, effective_date):
         for k, v in dic.items():
-            self._set_rate(k, v, effective_date)
+            self.rate_accumulator.add(k, effective_date, v)
 
-    def _set_rate(self, key: str, value: Dict[str, Any], effective_date: str):
-        # Use INSERT OR REPLACE with json_set to append to array
-        self._execute_and_log(
-            '''INSERT INTO rate_store (key, effective_date, value) 
-               VALUES (?, ?, json(?))
-               ON CONFLICT(key, effective_date) 
-               DO UPDATE SET value = json_patch(
-                   CASE 
-                       WHEN value IS NULL THEN '{}' 
-                       ELSE value 
-                   END,
-                   json(?)
-               )''',
-            (key, effective_date, json.dumps(value), json.dumps(value))
-        )
-    
     def _get_group_id(self, naic: str, state: str, location: str) -> int:
         cursor = self.conn.cursor()
         result = cursor.execute('''
@@ -344,7 +762,7 @@ class MedicareSupplementRateDB:
         logging.info(f"Getting key: {key} for effective date: {effective_date}")
         cursor = self.conn.cursor()
         result = cursor.execute(
-            'SELECT value FROM rate_store WHERE key = ? AND effective_date = ?', 
+            'SELECT value FROM rate_store_all WHERE key = ? AND effective_date = ?', 
             (key, effective_date)
         ).fetchone()
         
@@ -421,7 +839,7 @@ class MedicareSupplementRateDB:
         logging.info(f"Checking rate changes for state: {state}")
         
         # Get a random zip code for the state
-        state_zips = [k for k, v in self.zip_holder.zip_states.items() if v == state]
+        state_zips = self.zip_holder.lookup_zips_by_state(state)
         if not state_zips:
             logging.warning(f"No zip codes found for state: {state}")
             return
@@ -468,15 +886,9 @@ class MedicareSupplementRateDB:
             copy_empty_rate_tasks.append(self.copy_latest_rates(state, naic, effective_date))
         await asyncio.gather(*copy_empty_rate_tasks)
 
-        stored_rates = {k: self._get_rate(k, effective_date) for k in rdic.keys()}
-        sr = {}
-        for k, dic in stored_rates.items():
-            if dic is None:  # Handle case where no stored rates exist
-                sr[k] = None
-                continue
-                
-            test_case = dic.get("65:M:G:False")
-            sr[k] = test_case
+        await self.rate_writer.flush()
+        # only the 65:M:G:False cell is compared, so read just that cell
+        sr = {k: self._get_rate_cell(k, effective_date, 65, 'M', 'G', False) for k in rdic.keys()}
 
 
         s_dic = {}
@@ -496,10 +908,11 @@ class MedicareSupplementRateDB:
 
     async def get_rates_for_date(self, state: str, naic: str, effective_date: str) -> Dict:
         """Get all rates for a given state/naic combination on a specific date"""
+        await self.rate_writer.flush()
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT key, value 
-            FROM rate_store 
+            FROM rate_store_all 
             WHERE key LIKE ? AND effective_date = ?
         ''', (f"{state}:{naic}:%", effective_date))
         
@@ -517,25 +930,22 @@ class MedicareSupplementRateDB:
             logging.warning(f"No rates found to copy from {source_date} for {state} {naic}")
             return False
 
-        # Copy rates to target date
-        cursor = self.conn.cursor()
+        # Copy rates to target date; identical values share one blob
         for key, value in source_rates.items():
-            self._execute_and_log(
-                '''INSERT OR REPLACE INTO rate_store (key, effective_date, value)
-                   VALUES (?, ?, ?)''',
-                (key, target_date, json.dumps(value))
-            )
+            self._store_rate_ref(key, value, target_date)
+            self._replace_rate_rows(key, value, target_date)
         
         logging.info(f"Copied {len(source_rates)} rates from {source_date} to {target_date} for {state} {naic}")
         return True
     
     async def copy_latest_rates(self, state: str, naic: str, target_date: str, force: bool = False):
+        await self.rate_writer.flush()
         # Check if target date data exists and is valid JSON
         if not force:
             cursor = self.conn.cursor()
             cursor.execute('''
                 SELECT COUNT(*) 
-                FROM rate_store 
+                FROM rate_store_all 
                 WHERE key LIKE ? 
                 AND effective_date = ?
                 AND json_valid(value)
@@ -547,17 +957,15 @@ class MedicareSupplementRateDB:
 
         latest_rates = await self.get_most_recent_rates(state, naic)
         for key, value in latest_rates.items():
-            self._execute_and_log(
-                '''INSERT OR REPLACE INTO rate_store (key, effective_date, value)
-                   VALUES (?, ?, ?)''',
-                (key, target_date, json.dumps(value['rate_data']))
-            )
+            self._store_rate_ref(key, value['rate_data'], target_date)
+            self._replace_rate_rows(key, value['rate_data'], target_date)
             logging.info(f"Copied {key} rates from {value['effective_date']} to {target_date}")
         return True
             
     
     async def get_most_recent_rates(self, state: str, naic: str) -> Dict:
         """Get the most recent rates for each group_id for a given state/naic combination"""
+        await self.rate_writer.flush()
         cursor = self.conn.cursor()
         cursor.execute('''
             WITH RankedRates AS (
@@ -569,7 +977,7 @@ class MedicareSupplementRateDB:
                         PARTITION BY replace(replace(key, ?, ''), ':', '') 
                         ORDER BY effective_date DESC
                     ) as rn
-                FROM rate_store
+                FROM rate_store_all
                 WHERE key LIKE ?
                 AND json_valid(value)
             )
@@ -648,6 +1056,23 @@ def process_quote(q0, label):
         })
     return arr
 
+def latency_summary(samples):
+    """', latency p50/p95/max ...' for a label's fetch times, or '' if there are none."""
+    if not samples:
+        return ''
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return f", latency p50 {pick(0.5):.2f}s p95 {pick(0.95):.2f}s max {samples[-1]:.2f}s"
+
+def age_curve_matches(derived, quoted, age):
+    """Whether cells at `age` derived from earlier quotes agree with a quote for that age, to the cent."""
+    def cells(fr):
+        # last one wins, as when the fragments are saved
+        return {(q['gender'], q['plan'], q['tobacco']): q['rate'] for ls in fr for q in ls if q['age'] == age}
+    expected = cells(derived)
+    return all(k in expected and abs(to_cents(expected[k]) - to_cents(rate)) <= 1
+               for k, rate in cells(quoted).items())
+
 def winnow_quotes(quotes):
     unique_quotes = {}
     for quote in quotes:
@@ -0,0 +1,114 @@
+# carrier_categories.py
+import csv
+import os
+import re
+import threading
+import time
+
+
+def map_cat(a_or_b: str):
+    if a_or_b.lower() == "a":
+        return 0
+    elif a_or_b.lower() == "b":
+        return 1
+    else:
+        return 2
+
+
+def csv_to_dict(filename):
+    with open(filename, 'r') as file:
+        reader = csv.DictReader(file)
+        result = {}
+        for row in reader:
+            row["Category"] = map_cat(row["Category"])
+            # Check for null string key and filter it out
+            if "" in row:
+                del row[""]
+            # Replace blank strings with None
+            for key, value in row.items():
+                if value == '':
+                    row[key] = None
+            result[row["ID"]] = row
+    return result
+
+
+class CarrierCategories:
+    """Parsed view of cat.csv, loaded once and reloaded when the file changes.
+
+    Each NAIC row carries a display name, a category and up to nine sub-rating
+    labels (columns "1".."9") checked in column order against the quote's
+    "company // rating class" name. Household keywords from every row are
+    folded into one case-insensitive pattern. The file is stat'ed at most
+    every `check_interval` seconds.
+    """
+
+    def __init__(self, path: str = 'cat.csv', check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.loads = 0
+        self._lock = threading.Lock()
+        self._signature = None
+        self._checked_at = 0.0
+        self._rows = {}
+        self._subs = {}
+        self._household = None
+
+    def _load(self, signature):
+        rows = csv_to_dict(self.path)
+        subs = {}
+        keywords = set()
+        for naic, row in rows.items():
+            subs[naic] = [(str(i), row[str(i)], row[str(i)].lower())
+                          for i in range(1, 10) if row.get(str(i))]
+            if row.get('Household'):
+                keywords.add(row['Household'].lower())
+        # longest first so overlapping keywords can't shadow each other
+        pattern = '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+        self._rows = rows
+        self._subs = subs
+        self._household = re.compile(pattern) if pattern else None
+        self._signature = signature
+        self.loads += 1
+
+    def refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and self._signature is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                if self._signature is None:
+                    raise
+                return  # keep serving the last good copy
+            signature = (st.st_mtime_ns, st.st_size)
+            if force or signature != self._signature:
+                self._load(signature)
+
+    def get(self, naic):
+        self.refresh()
+        return self._rows.get(naic)
+
+    def match_sub(self, naic, name):
+        """First sub-rating label of `naic` contained in `name`, as (column, label)."""
+        self.refresh()
+        nm = name.lower()
+        for col, label, lowered in self._subs.get(naic, ()):
+            if lowered in nm:
+                return col, label
+        return None
+
+    def is_household(self, name) -> bool:
+        self.refresh()
+        return self._household is not None and self._household.search(name.lower()) is not None
+
+
+_registries = {}
+
+
+def get_carrier_categories(path: str = 'cat.csv') -> CarrierCategories:
+    registry = _registries.get(path)
+    if registry is None:
+        registry = _registries[path] = CarrierCategories(path)
+    return registry
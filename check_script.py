@@ -4,8 +4,7 @@ import random
 from datetime import datetime, timedelta
 from build_db_new import MedicareSupplementRateDB
 import asyncio
-from aiolimiter import AsyncLimiter
-from zips import zipHolder
+from zips import get_zip_holder
 import json
 import os
 import traceback
@@ -41,9 +40,9 @@ def get_default_effective_date(months_ahead: int = 0) -> str:
             target_date = (target_date + timedelta(days=32)).replace(day=1)
     return target_date.strftime('%Y-%m-%d')
 
-async def process_state_tasks(db, state, num_zips, rate_limiter, effective_date):
-    zip_holder = zipHolder("static/uszips.csv")
-    state_zips = [k for k, v in zip_holder.zip_states.items() if v == state]
+async def process_state_tasks(db, state, num_zips, effective_date):
+    zip_holder = get_zip_holder()
+    state_zips = zip_holder.lookup_zips_by_state(state)
     
     if not state_zips:
         logging.warning(f"No ZIP codes found for state: {state}")
@@ -52,8 +51,7 @@ async def process_state_tasks(db, state, num_zips, rate_limiter, effective_date)
     async def process_zip(random_zip):
         try:
             logging.info(f"Processing state: {state}, zip: {random_zip}, effective date: {effective_date}")
-            async with rate_limiter:
-                r, s, v = await db.check_rate_changes(state, random_zip, effective_date)
+            r, s, v = await db.check_rate_changes(state, random_zip, effective_date)
             return {
                 "zip": random_zip,
                 "state": state,
@@ -117,6 +115,7 @@ async def process_rate_changes(states_to_process, dates_to_process, num_zips=1,
         'changes': {}
     } for date in dates_to_process}
 
+    db = None
     try:
         if not no_sync:
             await sync_turso()
@@ -126,15 +125,13 @@ async def process_rate_changes(states_to_process, dates_to_process, num_zips=1,
         await db.cr.async_init()
         await db.cr.fetch_token()
 
-        rate_limiter = AsyncLimiter(20, 1)
-
         # Process each state
         tasks = []
         task_index = {}
         task_count = 0
         for state in states_to_process:
             for effective_date in dates_to_process:
-                state_tasks = await process_state_tasks(db, state, num_zips, rate_limiter, effective_date)
+                state_tasks = await process_state_tasks(db, state, num_zips, effective_date)
                 if state_tasks:
                     ii = task_count
                     task_count += len(state_tasks)
@@ -177,6 +174,9 @@ async def process_rate_changes(states_to_process, dates_to_process, num_zips=1,
         logging.error(f"Error in processing: {str(e)}")
         logging.error(traceback.format_exc())
         raise
+    finally:
+        if db is not None:
+            await db.close()
 
 async def main():
     parser = argparse.ArgumentParser(description="Test Medicare Supplement Rate changes.")
@@ -0,0 +1,34 @@
+import argparse
+import asyncio
+import json
+import logging
+from build_db_new import MedicareSupplementRateDB
+from backfill_rate_rows import setup_logging
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Deduplicate stored rates into hashed blobs and report the space saved")
+    parser.add_argument("-d", "--db", type=str, required=True, help="Database file path")
+    parser.add_argument("-s", "--state", nargs="+", help="Only compact these states (default: all)")
+    parser.add_argument("-b", "--before", type=str, help="Only compact effective dates before this one (YYYY-MM-DD)")
+    parser.add_argument("--report", action="store_true", help="Report storage use without compacting")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Suppress console output")
+    args = parser.parse_args()
+    setup_logging(args.quiet)
+
+    db = MedicareSupplementRateDB(db_path=args.db, log_operations=False)
+    try:
+        if not args.report:
+            for state in args.state or [None]:
+                moved = db.compact_rates(state, args.before)
+                logging.info(f"{state or 'all states'}: {moved} rate rows moved to blobs")
+        report = db.rate_storage_report()
+        logging.info(f"Rate storage: {report['refs']} refs to {report['blobs']} blobs, "
+                     f"{report['saved_bytes']:,} bytes saved; {report['rate_store_rows']} rows still inline")
+        print(json.dumps(report, indent=2))
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
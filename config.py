@@ -4,4 +4,36 @@ class Config(object):
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     CSG_TOKEN = os.environ.get('CSG_TOKEN') or None
     API_KEY = os.environ.get('API_KEY') or '2150e5ea35698640582ef9c511c8090210b2f7a0f8e53672094b8e5d3c7f9275'
+    # override the CSG endpoints, e.g. to run against csg_stub.py
+    CSG_BASE_URI = os.environ.get('CSG_BASE_URI') or None
+    CSG_TOKEN_URI = os.environ.get('CSG_TOKEN_URI') or None
+    # connection pool for the CSG client
+    CSG_HTTP2 = (os.environ.get('CSG_HTTP2') or '').lower() in ('1', 'true', 'yes')
+    CSG_MAX_CONNECTIONS = int(os.environ.get('CSG_MAX_CONNECTIONS') or 100)
+    CSG_MAX_KEEPALIVE = int(os.environ.get('CSG_MAX_KEEPALIVE') or 20)
+    CSG_KEEPALIVE_EXPIRY = float(os.environ.get('CSG_KEEPALIVE_EXPIRY') or 30.0)
+    # seconds a CSG token is assumed valid when neither its exp claim nor the token
+    # response says (0 = unknown: refresh only when CSG rejects it with 401/403)
+    CSG_TOKEN_TTL = int(os.environ.get('CSG_TOKEN_TTL') or 0)
+    # adaptive request rate (req/s) shared by every CSG caller in the process
+    CSG_RATE = float(os.environ.get('CSG_RATE') or 20)
+    CSG_MIN_RATE = float(os.environ.get('CSG_MIN_RATE') or 2)
+    CSG_MAX_RATE = float(os.environ.get('CSG_MAX_RATE') or 60)
+    # sqlite file for replaying quote responses across runs (unset = no cache)
+    CSG_CACHE_PATH = os.environ.get('CSG_CACHE_PATH') or None
+    # in-memory LRU in front of load_response / load_response_all (entries per process)
+    CSG_MEMO_SIZE = int(os.environ.get('CSG_MEMO_SIZE') or 4096)
+    # mapping probes kept in flight per carrier (1 = one at a time)
+    CSG_MAP_CONCURRENCY = int(os.environ.get('CSG_MAP_CONCURRENCY') or 4)
+    # order of mapping probes: 'planned' (probe_planner.py) or 'random'
+    CSG_PROBE_STRATEGY = os.environ.get('CSG_PROBE_STRATEGY') or 'planned'
+    # sqlite file logging mapping probes so interrupted runs resume (unset = off)
+    CSG_CHECKPOINT_PATH = os.environ.get('CSG_CHECKPOINT_PATH') or None
+    # rate writes (rate_store upserts and rate_row cells) per transaction, and the longest one waits (s)
+    RATE_WRITE_BATCH = int(os.environ.get('RATE_WRITE_BATCH') or 500)
+    RATE_WRITE_DELAY = float(os.environ.get('RATE_WRITE_DELAY') or 0.5)
+    # seconds a label's in-memory rate merge may stay open before a partial flush
+    RATE_MERGE_MAX_AGE = float(os.environ.get('RATE_MERGE_MAX_AGE') or 30.0)
+    # seconds before a rate fetch also tries the label's next fallback zip (0 = off, one zip at a time)
+    CSG_HEDGE_DELAY = float(os.environ.get('CSG_HEDGE_DELAY') or 0)
     #BASIC_AUTH_FORCE = True
@@ -1,4 +1,5 @@
 from build_db_new import MedicareSupplementRateDB
+from date_utils import copy_effective_date_data
 
 import asyncio
 from pprint import pprint
@@ -9,10 +10,6 @@ import time
 from datetime import datetime, timedelta
 ar = asyncio.run
 
-async def init(db):
-    await db.cr.async_init()
-    await db.cr.fetch_token()
-
 state_list = [
             "AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DE", "FL", "GA",
             "HI", "ID", "IL", "IN", "IA", "KS", "KY", "LA", "ME", "MD",
@@ -36,16 +33,16 @@ def get_default_effective_date(months_ahead: int = 0) -> str:
 
 async def main():
     import argparse
-    parser = argparse.ArgumentParser(description="Fetch quotes for random zip codes")
+    parser = argparse.ArgumentParser(description="Copy rates forward from one effective date to the following months")
     parser.add_argument("-d", "--db", type=str, help="Database to use")
     parser.add_argument("-m", "--months", type=int, default=3, help="Number of months to copy forward")
+    parser.add_argument("-s", "--state", nargs="+", help="Only these states (default: all)")
+    parser.add_argument("-n", "--naic", nargs="+", help="Only these carriers (default: all)")
+    parser.add_argument("--dry-run", action="store_true", help="Count the rows that would be copied without writing")
     parser.add_argument("start_date", type=str, help="Start date in YYYY-MM-DD format to copy rates from")
     args = parser.parse_args()
     db = MedicareSupplementRateDB(args.db)
 
-    # Initialize database connection and token inside the async context
-    await init(db)
-    tasks = []
     target_dates_all = [get_default_effective_date(i) for i in range(100)]
     # Find index of start_date in target_dates_all
     try:
@@ -55,21 +52,21 @@ async def main():
     # Get next m dates after start_date
     target_dates = target_dates_all[start_idx+1:start_idx+1+args.months]
     logging.info(f"Copying rates from {args.start_date} to dates: {target_dates}")
-    for state in state_list:
-        naics = db.get_existing_naics(state)
-        for naic in naics:
-            for td in target_dates:
-                tasks.append(db.copy_rates(state, naic, args.start_date, td))
-                                           
-    logging.info(f"Tasks: {len(tasks)}. Running sequentially.")
+
+    # one set-based transaction per target date
     start_time = time.time()
-    for t in tasks:
-        await t
+    try:
+        for td in target_dates:
+            counts = copy_effective_date_data(db, args.start_date, td, states=args.state,
+                                              naics=args.naic, dry_run=args.dry_run)
+            logging.info(f"{td}: {'would copy' if args.dry_run else 'copied'} {counts['rates']} rates, "
+                         f"{counts['rate_rows']} rate rows ({counts['replaced']} existing rates replaced)")
+    finally:
+        await db.close()
     end_time = time.time()
-    logging.info(f"Time taken: {end_time - start_time} seconds to run {len(tasks)} tasks")
+    logging.info(f"Time taken: {end_time - start_time} seconds for {len(target_dates)} dates")
     return db
     
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     db = asyncio.run(main())
-
-    
\ No newline at end of file
@@ -0,0 +1,198 @@
+# csg_cache.py
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from datetime import datetime
+
+
+def canonical_payload(payload: dict) -> dict:
+    """Normalize a CSG query so equivalent requests compare equal.
+
+    Keys are lowercased, zips zero-padded, numeric flags coerced to int and
+    NAIC lists sorted; None values are dropped.
+    """
+    out = {}
+    for k, v in payload.items():
+        k = k.lower()
+        if v is None:
+            continue
+        if k == 'zip5':
+            v = str(v).zfill(5)
+        elif k == 'naic' and isinstance(v, (list, tuple, set)):
+            v = sorted(str(x) for x in v)
+        elif k in ('age', 'tobacco', 'select', 'apply_discounts', 'apply_fees', 'offset'):
+            v = int(v)
+        else:
+            v = str(v)
+        out[k] = v
+    return out
+
+
+def payload_key(payload: dict) -> str:
+    blob = json.dumps(canonical_payload(payload), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache of CSG quote responses keyed by canonical payload.
+
+    Entries for effective dates already in force change rarely and live for
+    `settled_ttl`; upcoming effective dates can still be re-filed, so they
+    expire after `ttl`. The least recently used entries are evicted once the
+    file holds more than `max_entries`.
+    """
+
+    def __init__(self, path: str, ttl: float = 12 * 3600, settled_ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 500_000):
+        self.path = path
+        self.ttl = ttl
+        self.settled_ttl = settled_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS csg_response (
+                key TEXT PRIMARY KEY,
+                effective_date TEXT,
+                payload TEXT,
+                response TEXT,
+                expires_at REAL,
+                last_access REAL
+            )
+        ''')
+        self.conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_csg_response_access
+            ON csg_response(last_access)
+        ''')
+        self.conn.commit()
+
+    def ttl_for(self, effective_date) -> float:
+        try:
+            in_force = datetime.strptime(str(effective_date), '%Y-%m-%d') <= datetime.now()
+        except ValueError:
+            in_force = False
+        return self.settled_ttl if in_force else self.ttl
+
+    def get(self, payload: dict):
+        key = payload_key(payload)
+        row = self.conn.execute(
+            'SELECT response, expires_at FROM csg_response WHERE key = ?', (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or row[1] < now:
+            self.misses += 1
+            return None
+        self.conn.execute('UPDATE csg_response SET last_access = ? WHERE key = ?', (now, key))
+        self.conn.commit()
+        self.hits += 1
+        return json.loads(row[0])
+
+    def peek(self, payload: dict):
+        """Stored response regardless of expiry, without touching the counters."""
+        row = self.conn.execute(
+            'SELECT response FROM csg_response WHERE key = ?', (payload_key(payload),)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, payload: dict, response) -> None:
+        canonical = canonical_payload(payload)
+        effective_date = canonical.get('effective_date')
+        now = time.time()
+        self.conn.execute('''
+            INSERT OR REPLACE INTO csg_response
+                (key, effective_date, payload, response, expires_at, last_access)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (payload_key(payload), effective_date, json.dumps(canonical, sort_keys=True),
+              json.dumps(response), now + self.ttl_for(effective_date), now))
+        self.conn.commit()
+        self.stores += 1
+        if self.stores % 1000 == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used beyond max_entries."""
+        cur = self.conn.execute('DELETE FROM csg_response WHERE expires_at < ?', (time.time(),))
+        removed = cur.rowcount
+        count = self.conn.execute('SELECT COUNT(*) FROM csg_response').fetchone()[0]
+        if count > self.max_entries:
+            cur = self.conn.execute('''
+                DELETE FROM csg_response WHERE key IN (
+                    SELECT key FROM csg_response ORDER BY last_access LIMIT ?
+                )
+            ''', (count - self.max_entries,))
+            removed += cur.rowcount
+        self.conn.commit()
+        self.evictions += removed
+        return removed
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+        }
+
+    def close(self) -> None:
+        logging.info(f"CSG response cache {self.path}: {self.stats()}")
+        self.conn.close()
+
+
+class QuoteMemo:
+    """Bounded in-memory LRU of quote responses keyed by canonical payload.
+
+    Sits in front of the network for repeat lookups within one process;
+    entries older than `ttl` seconds are treated as misses.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 36_000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, payload: dict):
+        key = payload_key(payload)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return deepcopy(entry[1])
+
+    def put(self, payload: dict, response) -> None:
+        key = payload_key(payload)
+        self._entries[key] = (time.monotonic() + self.ttl, deepcopy(response))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'size': len(self._entries),
+            'evictions': self.evictions,
+        }
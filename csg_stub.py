@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# csg_stub.py
+"""Local stand-in for the CSG endpoints AsyncCSGRequest talks to.
+
+Serves med_supp/quotes.json, auth.json and the csg_token endpoint. Quote
+responses are replayed from a ResponseCache file recorded with --cache, and
+synthesized when there is no recording. Latency and 403/429/timeout faults
+can be injected for repeatable throughput runs against the build scripts:
+
+    python csg_stub.py --replay csg_cache.db --latency 0.05 --p429 0.01
+    CSG_BASE_URI=http://127.0.0.1:8765/v1/ \\
+    CSG_TOKEN_URI=http://127.0.0.1:8765/api/csg_token \\
+        python update_carrier.py -s SC -n 60052 -d scratch.db
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import uuid
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from csg_cache import ResponseCache, canonical_payload
+
+SYNTHETIC_NAICS = ['90001', '90002', '90003', '90004', '90005', '90006']
+
+
+def _stable(*parts) -> int:
+    digest = hashlib.md5(':'.join(str(p) for p in parts).encode()).hexdigest()
+    return int(digest[:8], 16)
+
+
+class SyntheticQuotes:
+    """Deterministic quote responses with zip3-based rating regions.
+
+    Each carrier cuts a state's sorted zip3 prefixes into a few contiguous
+    bands, offset per carrier, so regions are geographically clustered the
+    way real rating areas are. Carriers with an even NAIC rate by zip5 and
+    the rest by county, so both mapping paths get exercised.
+    """
+
+    def __init__(self, zip_holder=None, naics=None, regions_per_carrier: int = 4):
+        self.zips = zip_holder
+        self.naics = naics or SYNTHETIC_NAICS
+        self.regions_per_carrier = regions_per_carrier
+        self._prefixes = {}
+
+    def _region(self, naic, zip5):
+        state = self.zips.lookup_state2(zip5) if self.zips is not None else 'None'
+        if state == 'None':
+            return _stable(naic, zip5[:3]) % self.regions_per_carrier
+        prefixes = self._prefixes.get(state)
+        if prefixes is None:
+            prefixes = self._prefixes[state] = sorted({z[:3] for z in self.zips.lookup_zips_by_state(state)})
+        rank = (prefixes.index(zip5[:3]) + _stable(naic, 'offset')) % len(prefixes)
+        return rank * self.regions_per_carrier // len(prefixes)
+
+    def location_base(self, naic, zip5):
+        if self.zips is None:
+            return {'zip5': [zip5], 'county': []}
+        state = self.zips.lookup_state2(zip5)
+        region = self._region(naic, zip5)
+        members = [z for z in self.zips.lookup_zips_by_state(state)
+                   if self._region(naic, z) == region]
+        if int(naic) % 2 == 0:
+            return {'zip5': members, 'county': []}
+        counties = sorted({c for z in members for c in self.zips.lookup_county(z) if c != 'None'})
+        return {'zip5': [], 'county': counties}
+
+    def quote(self, naic, params):
+        zip5 = str(params.get('zip5', '')).zfill(5)
+        age = int(params.get('age', 65))
+        plan = params.get('plan', 'G')
+        gender = params.get('gender', 'M')
+        tobacco = int(params.get('tobacco', 0))
+        region = self._region(naic, zip5)
+        base = 9000 + _stable(naic, region, plan) % 9000
+        base = int(base * (1.1 if gender == 'M' else 1.0) * (1.25 if tobacco else 1.0))
+        base = int(base * 1.03 ** max(age - 65, 0))
+        span = 10 + _stable(naic, 'span') % 25
+        return {
+            'age': age,
+            'age_increases': [0.03] * span,
+            'company_base': {'naic': naic, 'name': f"Synthetic Carrier {naic}"},
+            'discounts': [],
+            'discount_category': None,
+            'fees': [],
+            'gender': gender,
+            'plan': plan,
+            'rate': {'month': base},
+            'rate_increases': [],
+            'rating_class': '',
+            'select': False,
+            'tobacco': tobacco,
+            'view_type': [],
+            'location_base': self.location_base(naic, zip5),
+        }
+
+    def quotes(self, params, naics):
+        wanted = naics or self.naics
+        return [self.quote(n, params) for n in wanted if n in self.naics]
+
+
+def create_app(replay: Optional[str] = None, synthetic: bool = True, latency: float = 0.0,
+               jitter: float = 0.0, p403: float = 0.0, p429: float = 0.0, p500: float = 0.0,
+               ptimeout: float = 0.0, timeout_delay: float = 65.0, seed: Optional[int] = None,
+               zip_holder=None) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(seed)
+    cache = ResponseCache(replay) if replay else None
+    generator = SyntheticQuotes(zip_holder) if synthetic else None
+    state = {'token': uuid.uuid4().hex}
+    stats = {'quotes': 0, 'replayed': 0, 'synthetic': 0, 'missing': 0, 'tokens': 0,
+             '403': 0, '429': 0, '500': 0, 'timeouts': 0}
+    app.state.stats = stats
+
+    def new_token():
+        state['token'] = uuid.uuid4().hex
+        stats['tokens'] += 1
+        return state['token']
+
+    async def delay():
+        wait = latency + (rng.uniform(0, jitter) if jitter else 0.0)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    @app.get("/api/csg_token")
+    async def csg_token():
+        await delay()
+        return {'csg_token': new_token()}
+
+    @app.post("/v1/auth.json")
+    async def auth():
+        await delay()
+        return {'token': new_token()}
+
+    @app.get("/v1/med_supp/quotes.json")
+    async def quotes(request: Request):
+        stats['quotes'] += 1
+        await delay()
+        if request.headers.get('x-api-token') != state['token']:
+            stats['403'] += 1
+            return JSONResponse(status_code=403, content={'error': 'invalid token'})
+        roll = rng.random()
+        if roll < ptimeout:
+            stats['timeouts'] += 1
+            await asyncio.sleep(timeout_delay)
+        elif roll < ptimeout + p403:
+            stats['403'] += 1
+            state['token'] = uuid.uuid4().hex  # simulate the token expiring
+            return JSONResponse(status_code=403, content={'error': 'token expired'})
+        elif roll < ptimeout + p403 + p429:
+            stats['429'] += 1
+            return JSONResponse(status_code=429, content={'error': 'rate limited'})
+        elif roll < ptimeout + p403 + p429 + p500:
+            stats['500'] += 1
+            return JSONResponse(status_code=500, content={'error': 'server error'})
+
+        params = dict(request.query_params)
+        naics = request.query_params.getlist('naic')
+        if len(naics) > 1:
+            params['naic'] = naics
+        if cache is not None:
+            recorded = cache.peek(canonical_payload(params))
+            if recorded is not None:
+                stats['replayed'] += 1
+                return recorded
+        if generator is not None:
+            stats['synthetic'] += 1
+            return generator.quotes(params, naics)
+        stats['missing'] += 1
+        return []
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the CSG API")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--replay", type=str, help="ResponseCache file recorded with --cache")
+    parser.add_argument("--no-synthetic", action="store_true", help="Return [] instead of synthetic quotes on a replay miss")
+    parser.add_argument("--zips", type=str, default="static/uszips.csv", help="Zip CSV used for synthetic regions")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--p403", type=float, default=0.0, help="Probability a quote request expires the token")
+    parser.add_argument("--p429", type=float, default=0.0, help="Probability of a 429 response")
+    parser.add_argument("--p500", type=float, default=0.0, help="Probability of a 500 response")
+    parser.add_argument("--ptimeout", type=float, default=0.0, help="Probability a request hangs past the client timeout")
+    parser.add_argument("--timeout-delay", type=float, default=65.0, help="How long a 'timed out' request hangs")
+    parser.add_argument("--seed", type=int, help="Seed for fault injection")
+    args = parser.parse_args()
+
+    import uvicorn
+    from zips import get_zip_holder
+
+    try:
+        zip_holder = get_zip_holder(args.zips)
+    except FileNotFoundError:
+        zip_holder = None
+    app = create_app(replay=args.replay, synthetic=not args.no_synthetic, latency=args.latency,
+                     jitter=args.jitter, p403=args.p403, p429=args.p429, p500=args.p500,
+                     ptimeout=args.ptimeout, timeout_delay=args.timeout_delay, seed=args.seed,
+                     zip_holder=zip_holder)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import List
+from typing import Dict, List, Optional
 import re
 
 def get_effective_dates(num_months: int = 6) -> List[str]:
@@ -48,27 +48,114 @@ def validate_effective_date(date_str: str) -> bool:
     except ValueError:
         return False
 
-def copy_effective_date_data(db, from_date: str, to_date: str) -> None:
+def _rate_filter(states: Optional[List[str]], naics: Optional[List[str]]):
+    """SQL condition and params limiting 'STATE:NAIC:GROUP' keys to states/naics."""
+    where, params = [], []
+    if states:
+        where.append('(' + ' OR '.join("key LIKE ?" for _ in states) + ')')
+        params.extend(f"{s}:%" for s in states)
+    if naics:
+        where.append('(' + ' OR '.join("key LIKE ?" for _ in naics) + ')')
+        params.extend(f"%:{n}:%" for n in naics)
+    return ''.join(' AND ' + w for w in where), params
+
+def _row_filter(states: Optional[List[str]], naics: Optional[List[str]]):
+    """The same filter for rate_row, which has state and naic columns."""
+    where, params = [], []
+    if states:
+        where.append(f"state IN ({', '.join('?' for _ in states)})")
+        params.extend(states)
+    if naics:
+        where.append(f"naic IN ({', '.join('?' for _ in naics)})")
+        params.extend(naics)
+    return ''.join(' AND ' + w for w in where), params
+
+def copy_effective_date_data(db, from_date: str, to_date: str, states: Optional[List[str]] = None,
+                             naics: Optional[List[str]] = None, dry_run: bool = False) -> Dict[str, int]:
     """
-    Copy rate store data from one effective date to another.
-    
+    Copy rate data from one effective date to another in one transaction.
+
+    Source rates still inline in rate_store are compacted into rate_blob
+    first, so the copy itself is set-based INSERT ... SELECTs: rate_ref
+    pointers and rate_row cells. The compaction commits on its own before
+    the copy's transaction starts; it only changes how the source date is
+    stored. Rates at the target date for the copied keys are replaced.
+    Flush db.rate_writer first if rate tasks are running.
+
     Args:
-        db: Database connection object
+        db: MedicareSupplementRateDB
         from_date (str): Source effective date in YYYY-MM-DD format
         to_date (str): Target effective date in YYYY-MM-DD format
+        states: Only copy these states (default: all)
+        naics: Only copy these carriers (default: all)
+        dry_run (bool): Count what would be copied without writing
+
+    Returns:
+        Dict[str, int]: rates and rate_rows copied, and target rates
+        (inline or referenced) replaced; a dry run returns the same counts
     """
     if not validate_effective_date(from_date) or not validate_effective_date(to_date):
         raise ValueError("Both dates must be in YYYY-MM-DD format and be the first day of a month")
-        
-    cursor = db.connect_turso()
-    
-    # Copy data from source date to target date
-    cursor.execute("""
-        INSERT OR REPLACE INTO rate_store (key, effective_date, value)
-        SELECT key, ?, value
-        FROM rate_store
-        WHERE effective_date = ?
-    """, (to_date, from_date))
-    
-    db.conn.commit()
 
+    key_where, key_params = _rate_filter(states, naics)
+    row_where, row_params = _row_filter(states, naics)
+    cursor = db.conn.cursor()
+    count_replaced = (f"""
+        SELECT COUNT(*) FROM rate_store_all t
+        WHERE t.effective_date = ?
+        AND t.key IN (SELECT key FROM rate_store_all WHERE effective_date = ?{key_where})
+    """, (to_date, from_date, *key_params))
+
+    if dry_run:
+        rates = cursor.execute(f"""
+            SELECT COUNT(*) FROM rate_store_all WHERE effective_date = ?{key_where}
+        """, (from_date, *key_params)).fetchone()[0]
+        rate_rows = cursor.execute(f"""
+            SELECT COUNT(*) FROM rate_row WHERE effective_date = ?{row_where}
+        """, (from_date, *row_params)).fetchone()[0]
+        replaced = cursor.execute(*count_replaced).fetchone()[0]
+        return {'rates': rates, 'rate_rows': rate_rows, 'replaced': replaced}
+
+    # inline source rows need a hash before they can be pointed at
+    for state in states or [None]:
+        db.compact_rates(state, effective_date=from_date)
+
+    statements = [
+        (f"""
+            DELETE FROM rate_store
+            WHERE effective_date = ?
+            AND key IN (SELECT key FROM rate_ref WHERE effective_date = ?{key_where})
+        """, (to_date, from_date, *key_params)),
+        (f"""
+            INSERT OR REPLACE INTO rate_ref (key, effective_date, hash)
+            SELECT key, ?, hash FROM rate_ref WHERE effective_date = ?{key_where}
+        """, (to_date, from_date, *key_params)),
+        (f"""
+            DELETE FROM rate_row WHERE effective_date = ?{row_where}
+            AND (state, naic, naic_group) IN (
+                SELECT state, naic, naic_group FROM rate_row WHERE effective_date = ?{row_where}
+            )
+        """, (to_date, *row_params, from_date, *row_params)),
+        (f"""
+            INSERT OR REPLACE INTO rate_row
+                (state, naic, naic_group, effective_date, plan, gender, tobacco, age,
+                 rate_cents, discount_rate_cents)
+            SELECT state, naic, naic_group, ?, plan, gender, tobacco, age,
+                   rate_cents, discount_rate_cents
+            FROM rate_row WHERE effective_date = ?{row_where}
+        """, (to_date, from_date, *row_params)),
+    ]
+    counts = []
+    try:
+        replaced = cursor.execute(*count_replaced).fetchone()[0]
+        for query, params in statements:
+            cursor.execute(query, params)
+            counts.append(cursor.rowcount)
+            if db.db_logger:
+                db.db_logger.log_operation('execute', query, params)
+        db.conn.commit()
+    except Exception:
+        db.conn.rollback()
+        raise
+    _, rates, _, rate_rows = counts
+    return {'rates': rates, 'rate_rows': rate_rows, 'replaced': replaced}
@@ -1,6 +1,13 @@
 from pydantic import BaseModel
 from typing import List, Optional
 import logging
+
+
+def to_cents(amount) -> int:
+    """Dollars to whole cents, rounded; every quote path converts through this."""
+    return int(round(float(amount) * 100))
+
+
 class Quote(BaseModel):
     age: int
     gender: str
@@ -95,8 +102,8 @@ def use_int(quote):
         gender=quote.gender,
         plan=quote.plan,
         tobacco=quote.tobacco,
-        rate=int(quote.rate*100),
-        discount_rate=int(quote.discount_rate*100),
+        rate=to_cents(quote.rate),
+        discount_rate=to_cents(quote.discount_rate),
         discount_category=quote.discount_category
     )
 
@@ -140,7 +147,7 @@ def use_int(quote):
         gender=quote.gender,
         plan=quote.plan,
         tobacco=quote.tobacco,
-        rate=int(quote.rate*100),
-        discount_rate=int(quote.discount_rate*100),
+        rate=to_cents(quote.rate),
+        discount_rate=to_cents(quote.discount_rate),
         discount_category=quote.discount_category
     )
@@ -51,13 +51,14 @@ async def main() -> None:
     parser.add_argument("-d", "--db", type=str, required=True, help="Database file name")
     parser.add_argument("-m", "--months", type=int, default=6, help="Number of months to process")
     parser.add_argument("--dry-run", action="store_true", help="Show what would be processed without making changes")
+    parser.add_argument("--cache", type=str, help="SQLite file for caching CSG responses so reruns replay locally")
 
     args = parser.parse_args()
     logging.info(f"args: {args}")
     setup_logging(args.quiet)
 
     if not args.dry_run:
-        db = MedicareSupplementRateDB(db_path=args.db)
+        db = MedicareSupplementRateDB(db_path=args.db, cache_path=args.cache)
         await db.cr.async_init()
         await db.cr.fetch_token()
 
@@ -117,7 +118,10 @@ async def main() -> None:
         rate_tasks.extend(db.get_rate_tasks(state, naic, effective_date))
 
     logging.info(f"Processing {len(rate_tasks)} rate tasks")
-    return await asyncio.gather(*rate_tasks)     
+    try:
+        return await asyncio.gather(*rate_tasks)
+    finally:
+        await db.close()
 
 
 
@@ -64,9 +64,9 @@ async def process_state_naics(db, state: str, effective_date: str, dic: dict):
     dic[state] = ls
  
 
-async def process_check_task(db, state: str, effective_date: str, dic: dict, available_naics: set, retry = 3):
+async def process_check_task(db, state: str, effective_date: str, dic: dict, available_naics: set):
     try:
-            # Create local results first
+        # transient CSG errors are already retried per request by the client's retry policy
         _, _, v = await db.check_rate_changes(state, None, effective_date, available_naics)
         vfilt = {k: v for k, v in v.items() if v}
         
@@ -78,9 +78,6 @@ async def process_check_task(db, state: str, effective_date: str, dic: dict, ava
             }
         return None
     except Exception as e:
-        if retry > 0:
-            logging.error(f"Error processing {state} at {effective_date}: {e}. Retrying...")
-            return await process_check_task(db, state, effective_date, dic, available_naics, retry - 1)
         logging.error(f"Error processing {state} at {effective_date}: {e}. Giving up.")
         return { 'state': state, 'changes': {}, 'error': str(e) }
     
@@ -96,13 +93,18 @@ async def main():
     parser.add_argument("-o", "--output", type=str, help="Output file name")
     parser.add_argument("--remap", action="store_true", help="Remap the rates if applicable before moving forward")
     parser.add_argument("--log-file", type=str, help="Custom log file for database operations")
+    parser.add_argument("--cache", type=str, help="SQLite file for caching CSG responses so reruns replay locally")
+    parser.add_argument("--checkpoint", type=str, default="mapping_checkpoint.db", help="SQLite file logging mapping probes so an interrupted run resumes")
+    parser.add_argument("--no-checkpoint", action="store_true", help="Map from scratch without reading or writing the checkpoint")
+    parser.add_argument("--verify", action="store_true", help="With --remap, patch only the mapping groups that changed instead of remapping")
     
     args = parser.parse_args()
     setup_logging(args.quiet)
     logger = logging.getLogger(__name__)
 
     logger.info("Connecting to database...")
-    db = MedicareSupplementRateDB(db_path=args.db, log_file=args.log_file)
+    db = MedicareSupplementRateDB(db_path=args.db, log_file=args.log_file, cache_path=args.cache,
+                                  checkpoint_path=None if args.no_checkpoint else args.checkpoint)
     await db.cr.async_init()
     await db.cr.fetch_token()
 
@@ -168,15 +170,18 @@ async def main():
             # Create semaphore for map tasks
             map_semaphore = asyncio.Semaphore(100)
 
-            async def bounded_set_map_task(naic, state):
+            async def bounded_set_map_task(state, naics):
                 async with map_semaphore:
-                    return await db.set_state_map_naic(naic, state)
+                    if args.verify:
+                        return [await db.verify_state_map_naic(naic, state) for naic in naics]
+                    # one shared probe sequence maps every changed carrier in the state
+                    return await db.set_state_map_all(state, naics)
 
             set_map_tasks = []
             for state, dic in changes.items():
-                for naic, bool_ in dic.items():
-                    if bool_:
-                        set_map_tasks.append(bounded_set_map_task(naic, state))
+                naics = [naic for naic, bool_ in dic.items() if bool_]
+                if naics:
+                    set_map_tasks.append(bounded_set_map_task(state, naics))
             logging.info(f"Setting state map for {len(set_map_tasks)} states in {len(set_map_tasks)} tasks...")
             await asyncio.gather(*set_map_tasks)
 
@@ -198,6 +203,7 @@ async def main():
 
 
     logger.info("Processing complete")
+    await db.close()
     
     if args.output:
         with open(args.output, 'w') as f:
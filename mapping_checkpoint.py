@@ -0,0 +1,113 @@
+# mapping_checkpoint.py
+import json
+import logging
+import sqlite3
+import time
+from copy import deepcopy
+
+
+def probe_key(params) -> str:
+    """Log key for a mapping probe: what varies between probes of one run."""
+    return json.dumps({k: str(params[k]) for k in ('zip5', 'county', 'plan') if params.get(k) is not None},
+                      sort_keys=True)
+
+
+class MappingRun:
+    """Probe log for one (state, naic, effective_date) mapping run."""
+
+    def __init__(self, checkpoint, state, naic, effective_date, probes):
+        self.checkpoint = checkpoint
+        self.state = state
+        self.naic = naic
+        self.effective_date = effective_date
+        self.probes = probes  # {probe key: quote response}, in the order they were made
+        self.replayed = 0
+
+    def get(self, key):
+        response = self.probes.get(key)
+        if response is None:
+            return None
+        self.replayed += 1
+        return deepcopy(response)
+
+    def record(self, key, response) -> None:
+        self.probes[key] = deepcopy(response)
+        self.checkpoint._record(self, key, response)
+
+    def zips(self):
+        """Zips probed so far, first probe first, so a resume can replay them in order."""
+        return list(dict.fromkeys(json.loads(key)['zip5'] for key in self.probes))
+
+
+class MappingCheckpoint:
+    """Local SQLite log of mapping probes so an interrupted run can resume.
+
+    Every quote a mapping run sends is written as it arrives. A rerun for the
+    same state, carrier and effective date replays those probes first, which
+    rebuilds the processed zips/counties and regions without calling CSG,
+    and then carries on exploring. Runs are cleared once their mapping is
+    saved.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._runs = {}
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS mapping_probe (
+                state TEXT,
+                naic TEXT,
+                effective_date TEXT,
+                probe TEXT,
+                response TEXT,
+                created_at REAL,
+                PRIMARY KEY (state, naic, effective_date, probe)
+            )
+        ''')
+        self.conn.commit()
+
+    def run(self, state: str, naic: str, effective_date: str) -> MappingRun:
+        key = (state, str(naic), effective_date)
+        run = self._runs.get(key)
+        if run is None:
+            rows = self.conn.execute('''
+                SELECT probe, response FROM mapping_probe
+                WHERE state = ? AND naic = ? AND effective_date = ?
+                ORDER BY created_at
+            ''', key).fetchall()
+            run = MappingRun(self, *key, {probe: json.loads(response) for probe, response in rows})
+            if rows:
+                logging.info(f"Resuming mapping {state}/{naic} for {effective_date} from {len(rows)} logged probes")
+            self._runs[key] = run
+        return run
+
+    def _record(self, run: MappingRun, key: str, response) -> None:
+        self.conn.execute('''
+            INSERT OR REPLACE INTO mapping_probe (state, naic, effective_date, probe, response, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (run.state, run.naic, run.effective_date, key, json.dumps(response), time.time()))
+        self.conn.commit()
+
+    def clear(self, state: str, naic: str, effective_date: str = None) -> None:
+        """Forget a finished run (every effective date if none is given)."""
+        if effective_date is None:
+            self.conn.execute('DELETE FROM mapping_probe WHERE state = ? AND naic = ?', (state, str(naic)))
+        else:
+            self.conn.execute('DELETE FROM mapping_probe WHERE state = ? AND naic = ? AND effective_date = ?',
+                              (state, str(naic), effective_date))
+        self.conn.commit()
+        for key in [k for k in self._runs if k[0] == state and k[1] == str(naic)
+                    and (effective_date is None or k[2] == effective_date)]:
+            del self._runs[key]
+
+    def pending(self):
+        """(state, naic, effective_date, probes) for every unfinished run."""
+        return self.conn.execute('''
+            SELECT state, naic, effective_date, COUNT(*) FROM mapping_probe
+            GROUP BY state, naic, effective_date
+        ''').fetchall()
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,90 @@
+# probe_planner.py
+"""Probe ordering for carrier region discovery.
+
+Carrier rating regions are made of neighbouring zips and counties, so a probe
+next to already-mapped territory usually just confirms a region we have. The
+planner groups items by locality (zip3 prefix and county for zips; shared-zip
+adjacency for counties) and always hands out the item whose groups hold the
+most territory nothing has covered yet. Groups lose weight quadratically as
+they fill in, so a half-explored group ranks below an untouched one of the
+same size, and groups with a probe still in flight are left alone until it
+lands.
+"""
+import random
+from typing import Callable, Dict, Iterable, List
+
+
+class ProbePlanner:
+    """Iterator over `items`, best next probe first.
+
+    `groups` maps each item to the locality keys it belongs to and
+    `is_covered` reports items already accounted for; both are consulted
+    lazily, so coverage learned from earlier probes steers later picks.
+    Items already handed out count as covered.
+    """
+
+    def __init__(self, items: Iterable[str], groups: Dict[str, List[str]],
+                 is_covered: Callable[[str], bool], seed=None):
+        self.items = list(items)
+        # shuffled so ties between equal scores break randomly
+        (random.Random(seed) if seed is not None else random).shuffle(self.items)
+        self.groups = {item: groups.get(item) or [item] for item in self.items}
+        self.is_covered = is_covered
+        self.members = {}
+        for item, keys in self.groups.items():
+            for key in keys:
+                self.members.setdefault(key, []).append(item)
+        self.taken = set()
+
+    def _open(self, item) -> bool:
+        return item not in self.taken and not self.is_covered(item)
+
+    def _score(self, item, unknown, in_flight) -> float:
+        score = 0.0
+        for key in self.groups[item]:
+            if key in in_flight:
+                continue  # a probe already out there will likely cover it
+            n = unknown.get(key)
+            if n is None:
+                n = unknown[key] = sum(1 for m in self.members[key] if self._open(m))
+            score += n * n / len(self.members[key])
+        return score
+
+    def __iter__(self):
+        while True:
+            unknown = {}
+            in_flight = {key for item in self.taken if not self.is_covered(item)
+                         for key in self.groups[item]}
+            best, best_score = None, -1.0
+            for item in self.items:
+                if self._open(item):
+                    score = self._score(item, unknown, in_flight)
+                    if score > best_score:
+                        best, best_score = item, score
+            if best is None:
+                return
+            self.taken.add(best)
+            yield best
+
+
+def zip_groups(zip_holder, zips: Iterable[str]) -> Dict[str, List[str]]:
+    """Locality keys for zip probes: the zip3 prefix and each county."""
+    return {
+        z: [f"zip3:{z[:3]}"] + [f"county:{c}" for c in zip_holder.lookup_county(z) if c != 'None']
+        for z in zips
+    }
+
+
+def county_groups(zip_holder, zips: Iterable[str]) -> Dict[str, List[str]]:
+    """Locality keys for county probes: the county itself plus every county
+    it shares a zip with, so a county's score counts its open neighbourhood."""
+    neighbours = {}
+    for z in zips:
+        counties = [c for c in zip_holder.lookup_county(z) if c != 'None']
+        for c in counties:
+            neighbours.setdefault(c, set()).update(counties)
+    groups = {}
+    for c, adjacent in neighbours.items():
+        for n in adjacent:
+            groups.setdefault(n, []).append(f"adj:{c}")
+    return groups
@@ -0,0 +1,271 @@
+# rate_writer.py
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict
+
+from filter_utils import to_cents
+
+# a (key, date) that copy-forward only stored as a rate_ref is seeded from
+# its blob, so the patch merges into the copied rates instead of hiding them
+UPSERT_RATE = '''INSERT INTO rate_store (key, effective_date, value)
+               VALUES (?, ?, json_patch(
+                   COALESCE((SELECT b.value FROM rate_ref r JOIN rate_blob b ON b.hash = r.hash
+                             WHERE r.key = ? AND r.effective_date = ?), '{}'),
+                   json(?)
+               ))
+               ON CONFLICT(key, effective_date)
+               DO UPDATE SET value = json_patch(
+                   CASE
+                       WHEN value IS NULL THEN '{}'
+                       ELSE value
+                   END,
+                   json(?)
+               )'''
+
+UPSERT_RATE_ROW = '''INSERT OR REPLACE INTO rate_row
+               (state, naic, naic_group, effective_date, plan, gender, tobacco, age,
+                rate_cents, discount_rate_cents)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+def rate_blob(value: Dict[str, Any]):
+    """(hash, canonical JSON) of a rate value, for the content-addressed rate_blob table."""
+    doc = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(doc.encode()).hexdigest(), doc
+
+
+def split_label(key: str):
+    """'STATE:NAIC:GROUP' -> (state, naic, naic_group)."""
+    state, naic, group = key.split(':')
+    return state, naic, int(group)
+
+
+def tobacco_flag(value) -> int:
+    # cells carry CSG's tobacco as a bool, older ones as 0/1
+    return int(value in (True, '1', 'True', 'true'))
+
+
+def rate_rows(key: str, value: Dict[str, Any], effective_date: str):
+    """rate_row tuples for the cells of one rate_store value."""
+    state, naic, group = split_label(key)
+    rows = []
+    for cell in value.values():
+        if not isinstance(cell, dict) or cell.get('rate') is None:
+            continue
+        rate = to_cents(cell['rate'])
+        discount = cell.get('discount_rate')
+        rows.append((state, naic, group, effective_date, cell['plan'], cell['gender'],
+                     tobacco_flag(cell['tobacco']), int(cell['age']), rate,
+                     rate if discount is None else to_cents(discount)))
+    return rows
+
+
+class RateWriter:
+    """Single writer for rate_store upserts and their rate_row cells.
+
+    Rate tasks hand their results to put(), which only enqueues. One writer
+    task drains the queue and writes a batch per transaction with
+    executemany: a batch closes at `batch_size` rows or `max_delay` seconds
+    after its first row, whichever comes first. Upserts for the same key are
+    applied in arrival order, so json_patch merges exactly as one-at-a-time
+    writes did, and each cell's rate_row is replaced in the same transaction
+    as its blob. Call flush() before reading rate_store and close() on shutdown.
+    """
+
+    def __init__(self, conn, db_logger=None, batch_size: int = 500, max_delay: float = 0.5):
+        self.conn = conn
+        self.db_logger = db_logger
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._queue = None
+        self._task = None
+        self._loop = None
+        self.rows = 0
+        self.batches = 0
+        self.failed = 0
+
+    def _ensure_task(self):
+        loop = asyncio.get_running_loop()
+        # the queue and task belong to the loop that started them; a script
+        # calling asyncio.run again gets a fresh pair (the old one is drained)
+        if self._loop is not loop:
+            if self._queue is not None and not self._queue.empty():
+                logging.warning(f"RateWriter: {self._queue.qsize()} rows left on a closed event loop")
+            self._queue = asyncio.Queue()
+            self._loop = loop
+            self._task = None
+        # on the same loop a stopped writer (e.g. after close()) restarts on the same queue
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    def put(self, key: str, value: Dict[str, Any], effective_date: str) -> None:
+        """Queue one upsert; returns immediately."""
+        self._ensure_task()
+        doc = json.dumps(value)
+        self._queue.put_nowait((UPSERT_RATE, (key, effective_date, key, effective_date, doc, doc)))
+        for row in rate_rows(key, value, effective_date):
+            self._queue.put_nowait((UPSERT_RATE_ROW, row))
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                self._write(batch)
+            except Exception as e:
+                # keep draining; rows behind this batch must still be written
+                logging.error(f"RateWriter: batch of {len(batch)} raised {e!r}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        # consecutive statements of one kind go out as one executemany
+        runs = []
+        for query, params in batch:
+            if runs and runs[-1][0] == query:
+                runs[-1][1].append(params)
+            else:
+                runs.append((query, [params]))
+        cursor = self.conn.cursor()
+        try:
+            for query, params in runs:
+                cursor.executemany(query, params)
+            self.conn.commit()
+        except Exception as e:
+            logging.error(f"RateWriter: batch of {len(batch)} failed ({e}); writing rows one by one")
+            self.conn.rollback()
+            self._write_rows(batch)
+            return
+        self.rows += len(batch)
+        self.batches += 1
+        if self.db_logger:
+            for query, params in runs:
+                self.db_logger.log_operation('executemany', query, params)
+
+    def _write_rows(self, batch):
+        cursor = self.conn.cursor()
+        for query, row in batch:
+            try:
+                cursor.execute(query, row)
+                self.conn.commit()
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"RateWriter: dropped row {row[:4]}: {e}")
+                self.conn.rollback()
+                continue
+            self.rows += 1
+            if self.db_logger:
+                self.db_logger.log_operation('execute', query, row)
+        self.batches += 1
+
+    async def flush(self) -> None:
+        """Wait until everything queued so far is committed."""
+        if self._queue is not None and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def close(self) -> None:
+        await self.flush()
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        logging.info(f"RateWriter: {self.stats()}")
+
+    def stats(self) -> dict:
+        return {
+            'rows': self.rows,
+            'batches': self.batches,
+            'failed': self.failed,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+class RateAccumulator:
+    """Merges a label's rate fragments in memory so its row is written once.
+
+    build_naic_requests registers how many tasks will report for a
+    (label, effective_date) with expect(); each task add()s its fragments
+    and calls done() when it finishes, success or not. The merged value goes
+    to the writer when the last task is done. A row whose merge has been
+    open for `max_age` seconds is flushed early as a partial patch, so a
+    crash loses at most that window. Fragments for keys nobody expects go
+    straight to the writer.
+    """
+
+    def __init__(self, writer: RateWriter, max_age: float = 30.0):
+        self.writer = writer
+        self.max_age = max_age
+        self._open = {}  # (key, effective_date) -> [tasks left, merged value, opened at]
+        self.fragments = 0
+        self.rows = 0
+        self.partial_flushes = 0
+
+    def expect(self, key: str, effective_date: str, tasks: int) -> None:
+        entry = self._open.get((key, effective_date))
+        if entry is None:
+            self._open[(key, effective_date)] = [tasks, {}, time.monotonic()]
+        else:
+            entry[0] += tasks
+
+    def add(self, key: str, effective_date: str, value: Dict[str, Any]) -> None:
+        self.fragments += 1
+        entry = self._open.get((key, effective_date))
+        if entry is None:
+            self.writer.put(key, value, effective_date)
+            self.rows += 1
+            return
+        entry[1].update(value)  # same last-fragment-wins merge as json_patch
+        if time.monotonic() - entry[2] >= self.max_age:
+            self._flush(key, effective_date, entry)
+            self.partial_flushes += 1
+
+    def done(self, key: str, effective_date: str) -> None:
+        entry = self._open.get((key, effective_date))
+        if entry is None:
+            return
+        entry[0] -= 1
+        if entry[0] <= 0:
+            self._flush(key, effective_date, entry)
+            del self._open[(key, effective_date)]
+
+    def _flush(self, key, effective_date, entry) -> None:
+        if entry[1]:
+            self.writer.put(key, entry[1], effective_date)
+            self.rows += 1
+        entry[1] = {}
+        entry[2] = time.monotonic()
+
+    def flush(self) -> None:
+        """Hand every open merge to the writer, e.g. on shutdown or after a failed run."""
+        for (key, effective_date), entry in self._open.items():
+            if entry[1]:
+                logging.warning(f"RateAccumulator: flushing {key} for {effective_date} with {entry[0]} tasks outstanding")
+            self._flush(key, effective_date, entry)
+        self._open.clear()
+
+    def stats(self) -> dict:
+        return {
+            'fragments': self.fragments,
+            'rows': self.rows,
+            'partial_flushes': self.partial_flushes,
+            'open': len(self._open),
+        }
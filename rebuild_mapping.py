@@ -19,7 +19,7 @@ def setup_logging(quiet: bool) -> None:
         ]
     )
 
-async def rebuild_state_naic_mapping(db, state, naic, dry_run=False):
+async def rebuild_state_naic_mapping(db, state, naic, dry_run=False, verify=False):
     """
     Rebuild the mapping for a specific carrier (NAIC) in a specific state.
     
@@ -28,6 +28,7 @@ async def rebuild_state_naic_mapping(db, state, naic, dry_run=False):
         state: State code (e.g., 'TX')
         naic: NAIC code of the carrier (e.g., '12345')
         dry_run: If True, don't actually update the database
+        verify: If True, check the stored groups and patch only those that changed
         
     Returns:
         dict: Results of the mapping operation
@@ -44,6 +45,13 @@ async def rebuild_state_naic_mapping(db, state, naic, dry_run=False):
             "naic": naic
         }
     
+    if verify:
+        try:
+            return {"success": True, **await db.verify_state_map_naic(naic, state)}
+        except Exception as e:
+            logging.error(f"Error verifying mapping for {naic} in {state}: {str(e)}")
+            return {"success": False, "state": state, "naic": naic, "error": str(e)}
+
     try:
         # First, delete existing mapping for this NAIC/state combination
         cursor = db.conn.cursor()
@@ -64,8 +72,8 @@ async def rebuild_state_naic_mapping(db, state, naic, dry_run=False):
             )
             db.conn.commit()
         
-        # Now rebuild the mapping
-        result = await db.set_state_map_naic(naic, state)
+        # Now rebuild the mapping; a rebuild maps from scratch rather than copying a sibling
+        result = await db.set_state_map_naic(naic, state, reuse_family=False)
         
         # Check how many mappings were created
         cursor.execute(
@@ -94,19 +102,55 @@ async def rebuild_state_naic_mapping(db, state, naic, dry_run=False):
             "error": str(e)
         }
 
-async def rebuild_all_for_state(db, state, dry_run=False):
-    """Rebuild mappings for all carriers in a specific state."""
+async def rebuild_all_for_state(db, state, dry_run=False, per_carrier=False, verify=False):
+    """Rebuild mappings for all carriers in a specific state.
+
+    By default every carrier is mapped from one shared sequence of probes;
+    per_carrier maps them one at a time as before, and verify patches each
+    carrier's stored groups instead of remapping.
+    """
     logging.info(f"Rebuilding all carrier mappings for state {state}")
     
     # Get all NAICs for this state
     naics = db.get_existing_naics(state)
     logging.info(f"Found {len(naics)} carriers for state {state}")
     
-    results = []
+    if per_carrier or dry_run or verify:
+        results = []
+        for naic in naics:
+            result = await rebuild_state_naic_mapping(db, state, naic, dry_run, verify)
+            results.append(result)
+        return results
+
+    cursor = db.conn.cursor()
+    previous = {}
     for naic in naics:
-        result = await rebuild_state_naic_mapping(db, state, naic, dry_run)
-        results.append(result)
-        
+        cursor.execute(
+            "SELECT COUNT(*) FROM group_mapping WHERE state = ? AND naic = ?",
+            (state, naic)
+        )
+        previous[naic] = cursor.fetchone()[0]
+
+    try:
+        mapped = await db.set_state_map_all(state, naics, replace=True)
+    except Exception as e:
+        logging.error(f"Error rebuilding shared mapping for {state}: {str(e)}")
+        return [{"success": False, "state": state, "naic": naic, "error": str(e)} for naic in naics]
+
+    results = []
+    for naic in sorted(naics):
+        cursor.execute(
+            "SELECT COUNT(*) FROM group_mapping WHERE state = ? AND naic = ?",
+            (state, naic)
+        )
+        results.append({
+            "success": True,
+            "state": state,
+            "naic": naic,
+            "previous_mappings": previous[naic],
+            "new_mappings": cursor.fetchone()[0],
+            "mapping_result": mapped.get(naic, False)
+        })
     return results
 
 async def main():
@@ -119,6 +163,11 @@ async def main():
     parser.add_argument("-q", "--quiet", action="store_true", help="Suppress console output")
     parser.add_argument("--dry-run", action="store_true", help="Show what would be updated without making changes")
     parser.add_argument("--out", type=str, help="Path to output file to save results")
+    parser.add_argument("--cache", type=str, help="SQLite file for caching CSG responses so reruns replay locally")
+    parser.add_argument("--checkpoint", type=str, default="mapping_checkpoint.db", help="SQLite file logging mapping probes so an interrupted run resumes")
+    parser.add_argument("--no-checkpoint", action="store_true", help="Map from scratch without reading or writing the checkpoint")
+    parser.add_argument("--per-carrier", action="store_true", help="Map carriers one at a time instead of from shared state probes")
+    parser.add_argument("--verify", action="store_true", help="Probe each stored group and re-explore only the groups that changed")
     
     args = parser.parse_args()
     setup_logging(args.quiet)
@@ -144,7 +193,8 @@ async def main():
 
     # Initialize database connection
     if not args.dry_run:
-        db = MedicareSupplementRateDB(db_path=args.db)
+        db = MedicareSupplementRateDB(db_path=args.db, cache_path=args.cache,
+                                      checkpoint_path=None if args.no_checkpoint else args.checkpoint)
         await db.cr.async_init()
         await db.cr.fetch_token()
     else:
@@ -160,7 +210,7 @@ async def main():
             states = [row[0] for row in cursor.fetchall()]
             
             for state in states:
-                state_results = await rebuild_all_for_state(db, state, args.dry_run)
+                state_results = await rebuild_all_for_state(db, state, args.dry_run, args.per_carrier, args.verify)
                 results.extend(state_results)
         else:
             logging.info("DRY RUN - Would rebuild all mappings for all states")
@@ -168,12 +218,12 @@ async def main():
             
     elif args.all_for_state:
         # Rebuild all carrier mappings for this state
-        results = await rebuild_all_for_state(db, args.state, args.dry_run)
+        results = await rebuild_all_for_state(db, args.state, args.dry_run, args.per_carrier, args.verify)
         
     elif args.naic:
         # Rebuild mapping for specific carrier in specific state
         if not args.dry_run:
-            result = await rebuild_state_naic_mapping(db, args.state, args.naic, args.dry_run)
+            result = await rebuild_state_naic_mapping(db, args.state, args.naic, args.dry_run, args.verify)
             results.append(result)
         else:
             results.append({
@@ -192,7 +242,7 @@ async def main():
                 naics = []
                 
             for naic in naics:
-                result = await rebuild_state_naic_mapping(db, args.state, naic, args.dry_run)
+                result = await rebuild_state_naic_mapping(db, args.state, naic, args.dry_run, args.verify)
                 results.append(result)
         else:
             results.append({
@@ -201,6 +251,9 @@ async def main():
                 "message": f"Would rebuild all carrier mappings for state {args.state}"
             })
     
+    if db is not None:
+        await db.close()
+
     # Print results
     print(json.dumps(results, indent=2))
     
@@ -0,0 +1,70 @@
+# region_registry.py
+from bisect import insort
+from typing import Dict, Hashable, Iterable, List, Optional, Set
+
+
+class RegionRegistry:
+    """Distinct rating regions found while mapping one carrier.
+
+    Regions are indexed by the frozenset of their members, so a probe result
+    is matched against every known region with one hash lookup instead of a
+    scan, and each zip/county points back to the region that claimed it.
+    Counts how many probes merged into an existing region (collisions) and
+    how many items moved from one region to another.
+    """
+
+    def __init__(self):
+        self.regions: List[Set] = []
+        # positions holding each member set, lowest first, as a scan would find them
+        self._by_members: Dict[frozenset, List[int]] = {}
+        self._item_region: Dict[Hashable, int] = {}
+        self.probes = 0
+        self.collisions = 0
+        self.reassigned = 0
+
+    def add(self, members: Iterable, probe: Optional[Hashable] = None) -> int:
+        """Record a probe result and return its region's position.
+
+        A result equal to a known region replaces it with the result plus the
+        probed item; anything else becomes a new region.
+        """
+        members = set(members)
+        self.probes += 1
+        key = frozenset(members)
+        if probe is not None:
+            members.add(probe)
+        matches = self._by_members.get(key)
+        if matches:
+            i = matches.pop(0)
+            if not matches:
+                del self._by_members[key]
+            self.collisions += 1
+            self.regions[i] = members
+        else:
+            i = len(self.regions)
+            self.regions.append(members)
+        insort(self._by_members.setdefault(frozenset(members), []), i)
+        for item in members:
+            prev = self._item_region.get(item)
+            if prev is not None and prev != i:
+                self.reassigned += 1
+            self._item_region[item] = i
+        return i
+
+    def region_of(self, item) -> Optional[Set]:
+        i = self._item_region.get(item)
+        return None if i is None else self.regions[i]
+
+    def __contains__(self, item) -> bool:
+        return item in self._item_region
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def stats(self) -> dict:
+        return {
+            'regions': len(self.regions),
+            'probes': self.probes,
+            'collisions': self.collisions,
+            'reassigned': self.reassigned,
+        }
@@ -0,0 +1,50 @@
+import asyncio
+from collections import deque
+
+from async_csg import AsyncCSGRequest
+from probe_planner import ProbePlanner
+
+
+def make_client():
+    return AsyncCSGRequest('test', base_uri='http://stub/v1/', token_uri='http://stub/api/csg_token')
+
+
+def test_planner_is_read_lazily_with_probes_in_flight():
+    # ten localities of ten zips; a probe covers its whole locality
+    items = [f"{g}{i}" for g in 'abcdefghij' for i in range(10)]
+    groups = {item: [item[0]] for item in items}
+    covered = set()
+    pulled = []
+    visited = []
+
+    def planned():
+        for item in ProbePlanner(items, groups, covered.__contains__, seed=1):
+            pulled.append(item)
+            yield item
+
+    async def visit(item):
+        visited.append((item, len(pulled)))
+        await asyncio.sleep(0)
+        covered.update(i for i in items if i[0] == item[0])
+
+    assert asyncio.run(make_client().explore(planned(), visit, covered.__contains__, concurrency=4))
+    assert covered == set(items)
+    # the first probes start before the planner is asked for more than it needs
+    assert visited[0][1] <= 4
+    # the planner only hands out uncovered items, so nothing it yields is wasted;
+    # drained up front it would have yielded all 100
+    assert len(pulled) == len(visited) < len(items)
+
+
+def test_items_added_while_probes_are_in_flight_are_explored():
+    more = deque()
+    seen = []
+
+    async def visit(item):
+        seen.append(item)
+        await asyncio.sleep(0)
+        if item < 3:
+            more.append(item + 10)  # found late, after the items ran out
+
+    assert asyncio.run(make_client().explore([0, 1, 2], visit, lambda item: False, concurrency=4, more=more))
+    assert sorted(seen) == [0, 1, 2, 10, 11, 12]
@@ -0,0 +1,53 @@
+import asyncio
+from copy import deepcopy
+
+import pytest
+
+from build_db_new import MedicareSupplementRateDB
+
+QUOTE = [{'naic': '60052', 'rate': {'month': 12345}}]
+
+
+class FakeCSG:
+    """Answers load_response_inner from a zip -> quotes (or exception) table."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    async def load_response_inner(self, args, retry=3):
+        self.calls.append(args['zip5'])
+        await asyncio.sleep(0)
+        answer = self.answers.get(args['zip5'], [])
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def fetch(answers, args, hedge_delay):
+    db = object.__new__(MedicareSupplementRateDB)  # no database needed
+    db.cr = FakeCSG(answers)
+    db.fetch_latency = {}
+    db.hedged = 0
+    result = asyncio.run(db.fetch_helper(deepcopy(args), hedge_delay=hedge_delay))
+    return result, db.cr.calls
+
+
+CASES = {
+    'first zip answers': ({'00001': QUOTE}, ['00002', '00003']),
+    'no fallback zips': ({'00001': QUOTE}, []),
+    'one fallback zip': ({'00002': QUOTE}, ['00002']),
+    'empty then error then quotes': ({'00003': RuntimeError('boom'), '00004': QUOTE},
+                                     ['00002', '00003', '00004', '00005']),
+    'fallback repeats the first zip': ({'00001': [], '00003': QUOTE}, ['00001', '00001', '00003']),
+    'everything empty': ({}, [f"{i:05d}" for i in range(2, 12)]),
+}
+
+
+@pytest.mark.parametrize('name', CASES)
+def test_hedged_fetch_matches_sequential(name):
+    answers, fallback = CASES[name]
+    args = {'zip5': '00001', 'zip5_fallback': fallback, 'label': 'SC:60052:1', 'age': 65}
+    sequential = fetch(answers, args, hedge_delay=0)
+    hedged = fetch(answers, args, hedge_delay=5.0)
+    assert hedged == sequential
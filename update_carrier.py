@@ -63,6 +63,7 @@ async def update_specific_carrier(db, state, naic, effective_date, dry_run=False
         
         if rate_tasks:
             results = await asyncio.gather(*rate_tasks)
+            await db.rate_writer.flush()
             logging.info(f"Completed {len(results)} rate tasks successfully")
             return {
                 "success": True,
@@ -103,6 +104,7 @@ async def main():
     parser.add_argument("-q", "--quiet", action="store_true", help="Suppress console output")
     parser.add_argument("--dry-run", action="store_true", help="Show what would be processed without making changes")
     parser.add_argument("--out", type=str, help="Path to output file to save results")
+    parser.add_argument("--cache", type=str, help="SQLite file for caching CSG responses so reruns replay locally")
     
     args = parser.parse_args()
     setup_logging(args.quiet)
@@ -111,7 +113,7 @@ async def main():
     effective_dates = get_effective_dates(args.effective_date, args.months)
     
     if not args.dry_run:
-        db = MedicareSupplementRateDB(db_path=args.db)
+        db = MedicareSupplementRateDB(db_path=args.db, cache_path=args.cache)
         await db.cr.async_init()
         await db.cr.fetch_token()
         
@@ -120,6 +122,7 @@ async def main():
         for effective_date in effective_dates:
             result = await update_specific_carrier(db, args.state, args.naic, effective_date, args.dry_run)
             all_results.append(result)
+        await db.close()
     else:
         all_results = [
             await update_specific_carrier(None, args.state, args.naic, date, args.dry_run)
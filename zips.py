@@ -1,6 +1,87 @@
 # zips.py
+import os
+import pickle
+from array import array
+from bisect import bisect_left
 from csv import DictReader
 
+INDEX_VERSION = 1
+
+
+def index_path(file_name):
+    return f"{file_name}.idx"
+
+
+def build_index(file_name):
+    """Compile the zip CSV into sorted parallel arrays.
+
+    Zips are ints, states and counties are interned into small-int ids, and
+    each zip's counties are the slice county_ids[county_start[i]:county_start[i+1]].
+    """
+    rows = {}
+    with open(file_name, mode='r') as cf:
+        cr = DictReader(cf)
+        first_row = True
+        for row in cr:
+            if first_row:
+                first_row = False
+            else:
+                rows[int(row['zip'])] = (row['state_id'],
+                                         [i.upper() for i in row['county_names_all'].split('|')])
+
+    states, state_ids = [], {}
+    counties, county_ids_by_name = [], {}
+    zips = array('I')
+    state = array('B')
+    county_start = array('I', [0])
+    county_ids = array('H')
+    for zip5, (st, clist) in sorted(rows.items()):
+        zips.append(zip5)
+        if st not in state_ids:
+            state_ids[st] = len(states)
+            states.append(st)
+        state.append(state_ids[st])
+        for c in clist:
+            if c not in county_ids_by_name:
+                county_ids_by_name[c] = len(counties)
+                counties.append(c)
+            county_ids.append(county_ids_by_name[c])
+        county_start.append(len(county_ids))
+    return {
+        'zips': zips,
+        'state': state,
+        'county_start': county_start,
+        'county_ids': county_ids,
+        'states': states,
+        'counties': counties,
+    }
+
+
+def load_index(file_name):
+    """Compiled index for file_name, rebuilt when the CSV's mtime or size changes."""
+    st = os.stat(file_name)
+    source = (INDEX_VERSION, st.st_mtime_ns, st.st_size)
+    path = index_path(file_name)
+    try:
+        with open(path, 'rb') as f:
+            stored_source, index = pickle.load(f)
+        if stored_source == source:
+            return index
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+        pass
+    index = build_index(file_name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            pickle.dump((source, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        # read-only checkout: keep the in-memory index, rebuild next start
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return index
+
+
 class zipHolder():
 
     def __init__(self, file_name):
@@ -13,53 +94,110 @@ class zipHolder():
             return county, state
         return county
 
+    def _pos(self, zip5):
+        try:
+            key = int(zip5)
+        except (TypeError, ValueError):
+            return None
+        i = bisect_left(self._zips, key)
+        if i < len(self._zips) and self._zips[i] == key:
+            return i
+        return None
+
+    def _counties_at(self, i):
+        return [self._counties[c] for c in self._county_ids[self._county_start[i]:self._county_start[i + 1]]]
+
     def lookup_county(self, zip5):
-        return self.zip_counties.get(str(zip5).zfill(5), ['None'])
-    
+        i = self._pos(zip5)
+        return ['None'] if i is None else self._counties_at(i)
+
     def lookup_county2(self, zip5):
-        return self.zip_counties.get(str(zip5).zfill(5), None)
+        i = self._pos(zip5)
+        return None if i is None else self._counties_at(i)
 
     def lookup_state(self, zip5):
-        return self.zip_states.get(str(zip5).zfill(5), ['None'])
+        i = self._pos(zip5)
+        return ['None'] if i is None else self._states[self._state[i]]
 
     def lookup_state2(self, zip5):
-        return self.zip_states.get(str(zip5).zfill(5), 'None')
+        i = self._pos(zip5)
+        return 'None' if i is None else self._states[self._state[i]]
 
     def lookup_zip_by_county(self, state, county):
         return self.zip_by_county.get(f"{state.upper()}",{}).get(county.upper(), [])
-    
+
     def lookup_zips_by_state(self, state):
-        return self.zip_by_states.get(state, [])
+        # a copy, since mapping code shuffles it in place
+        return list(self.zip_by_states.get(state, []))
+
+    def lookup_counties_by_state(self, state):
+        return set(self.counties_by_state.get(state, ()))
+
+    def lookup_single_county_zips(self, state):
+        """{county: [zips lying wholly in that county]} for a state."""
+        return {c: list(zs) for c, zs in self.single_county_zips.get(state, {}).items()}
 
     def load_zips(self, file_name):
-        zip_c = {}
-        zip_s = {}
-        with open(file_name, mode='r') as cf:
-            cr = DictReader(cf)
-            first_row = True
-            for row in cr:
-                if first_row:
-                    first_row = False
-                else:
-                    zip_c[(row['zip'])] = [
-                        i.upper() for i in row['county_names_all'].split('|')
-                    ]
-                    zip_s[(row['zip'])] = row['state_id']
+        index = load_index(file_name)
+        self._zips = index['zips']
+        self._state = index['state']
+        self._county_start = index['county_start']
+        self._county_ids = index['county_ids']
+        self._states = index['states']
+        self._counties = index['counties']
+        self._derived = None
+
+    def _build_derived(self):
+        # state/county groupings, built on first use; point lookups never need them
         zip_by_county = {}
-        for zip, clist in zip_c.items():
-            for c in clist:
-                state = zip_s.get(zip)
-                dic = zip_by_county.get(state, {})
-                ls = dic.get(c, [])
-                ls.append(zip)
-                dic[c] = ls
-                zip_by_county[state] = dic
-        self.zip_counties = zip_c
-        self.zip_states = zip_s
-        self.zip_by_county = zip_by_county
         zip_by_states = {}
-        for zip, state in zip_s.items():
-            ls = zip_by_states.get(state, [])
-            ls.append(zip)
-            zip_by_states[state] = ls
-        self.zip_by_states = zip_by_states
+        counties_by_state = {}
+        single_county_zips = {}
+        for i, key in enumerate(self._zips):
+            zip = str(key).zfill(5)
+            state = self._states[self._state[i]]
+            clist = self._counties_at(i)
+            zip_by_states.setdefault(state, []).append(zip)
+            dic = zip_by_county.setdefault(state, {})
+            for c in clist:
+                dic.setdefault(c, []).append(zip)
+            counties_by_state.setdefault(state, set()).update(c for c in clist if c != 'None')
+            if len(clist) == 1:
+                single_county_zips.setdefault(state, {}).setdefault(clist[0], []).append(zip)
+        self._derived = (zip_by_county, zip_by_states, counties_by_state, single_county_zips)
+        return self._derived
+
+    @property
+    def zip_by_county(self):
+        return (self._derived or self._build_derived())[0]
+
+    @property
+    def zip_by_states(self):
+        return (self._derived or self._build_derived())[1]
+
+    @property
+    def counties_by_state(self):
+        return (self._derived or self._build_derived())[2]
+
+    @property
+    def single_county_zips(self):
+        return (self._derived or self._build_derived())[3]
+
+    @property
+    def zip_states(self):
+        return {str(key).zfill(5): self._states[self._state[i]] for i, key in enumerate(self._zips)}
+
+    @property
+    def zip_counties(self):
+        return {str(key).zfill(5): self._counties_at(i) for i, key in enumerate(self._zips)}
+
+
+_holders = {}
+
+
+def get_zip_holder(file_name='static/uszips.csv'):
+    """Process-wide zipHolder for file_name, loaded on first use."""
+    holder = _holders.get(file_name)
+    if holder is None:
+        holder = _holders[file_name] = zipHolder(file_name)
+    return holder